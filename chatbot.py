@@ -1,6 +1,5 @@
 import os
 import logging
-from dotenv import load_dotenv
 
 # 导入自定义模块
 try:
@@ -22,19 +21,20 @@ except ImportError as e:
 
 # 导入环境变量管理器
 try:
-    from env_manager import get_env_manager
+    from env_manager import get_env_manager, mask_api_key
     env_manager = get_env_manager()
 except ImportError:
     env_manager = None
     print("警告: 环境变量管理器不可用，使用默认配置")
+    
+    def mask_api_key(api_key, visible=5):
+        """环境变量管理器不可用时，日志中不输出密钥的任何部分"""
+        return "***"
 
 # 日志配置
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 加载环境变量
-load_dotenv()
-
 # 全局变量
 chat_handler = None
 document_processor = None
@@ -51,7 +51,7 @@ def setup_components():
     if has_langchain:
         try:
             model_type = os.getenv("LLM_MODEL_TYPE", "openai")
-            logger.info(f"正在创建聊天处理器，模型类型: {model_type}, API Key: {os.getenv('OPENAI_API_KEY')[:5]}***")
+            logger.info(f"正在创建聊天处理器，模型类型: {model_type}, API Key: {mask_api_key(os.getenv('OPENAI_API_KEY'))}")
             chat_handler = create_chat_handler(model_type)
             logger.info(f"成功创建聊天处理器，使用模型类型: {model_type}")
         except Exception as e:
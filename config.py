@@ -9,6 +9,11 @@ class DefaultConfig:
     
     # 模型配置（仅支持OpenAI）
     DEFAULT_OPENAI_MODEL = "gpt-4o-mini"
+    DEFAULT_MAX_CONTEXT_MESSAGES = 40  # 发送给模型的最近消息数（不含系统提示和本次消息，按整轮对话计，须为偶数）
+    DEFAULT_HISTORY_TURNS = 10  # RAG链保留的最近对话轮数（每轮一问一答）
+    DEFAULT_SEMANTIC_CACHE_SIZE = 256  # 语义缓存的问题数（0表示禁用）
+    DEFAULT_SEMANTIC_CACHE_THRESHOLD = 0.92  # 语义缓存命中所需的最小余弦相似度
+    DEFAULT_SEMANTIC_CACHE_TTL = 300  # 语义缓存条目的有效期（秒，0表示不过期）
     
     # 向量数据库配置
     DEFAULT_VECTOR_DB_PATH = "./vector_db"
@@ -77,6 +77,11 @@ class DocumentProcessor:
         """
         return self._enhanced_processor.process_all_documents()
     
+    @property
+    def index_version(self) -> int:
+        """向量数据库内容的版本号，文档写入后递增"""
+        return self._enhanced_processor.index_version
+    
     def get_vectorstore(self):
         """获取向量数据库实例"""
         return self._enhanced_processor.get_vectorstore()
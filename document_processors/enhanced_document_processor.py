@@ -6,6 +6,7 @@
 import os
 import logging
 import glob
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import json
@@ -94,9 +95,19 @@ class EnhancedDocumentProcessor:
         
         logger.info(f"支持的文件格式: {', '.join(sorted(self.supported_extensions))}")
         
+        # 文档块分批并发向量化（嵌入接口的延迟主要在网络上）
+        self.embed_batch_size = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+        self.embed_workers = int(os.getenv("EMBED_WORKERS", "4"))
+        self._embed_pool = ThreadPoolExecutor(
+            max_workers=self.embed_workers,
+            thread_name_prefix="embed"
+        )
+        
         # 初始化嵌入模型和向量数据库
         self.embeddings = self._init_embeddings()
         self.vectorstore = self._init_vectorstore()
+        # 向量数据库内容的版本号，每次写入文档后加一，搜索结果缓存据此判断是否失效
+        self.index_version = 0
         
         # 文档元数据缓存
         self.document_metadata = self._load_document_metadata()
@@ -204,11 +215,24 @@ class EnhancedDocumentProcessor:
             return False
         
         try:
+            # 文件大小和修改时间与上次处理时一致时直接跳过，无需读取文件计算哈希
+            stat_result = os.stat(file_path)
+            previous = self.document_metadata.get(file_path)
+            if previous and previous.get("size") == stat_result.st_size \
+                    and previous.get("mtime_ns") == stat_result.st_mtime_ns:
+                logger.info(f"文档未更改，跳过处理: {file_path}")
+                return True
+            
             # 检查文档是否需要重新处理
             doc_hash = processor.get_document_hash(file_path)
             
-            if file_path in self.document_metadata:
-                if self.document_metadata[file_path].get("hash") == doc_hash:
+            if previous:
+                if previous.get("hash") == doc_hash:
+                    # 内容未变（旧元数据没有记录大小和修改时间，或文件只被touch过），
+                    # 记下当前的大小和修改时间，之后无需再读取文件计算哈希
+                    previous["size"] = stat_result.st_size
+                    previous["mtime_ns"] = stat_result.st_mtime_ns
+                    self._save_document_metadata()
                     logger.info(f"文档未更改，跳过处理: {file_path}")
                     return True
                 else:
@@ -231,13 +255,21 @@ class EnhancedDocumentProcessor:
             
             # 添加到向量数据库
             logger.info(f"向量化并添加到数据库: {file_path} ({len(documents)} 个块)")
-            self.vectorstore.add_documents(documents)
+            texts = [doc.page_content for doc in documents]
+            vectors = self._embed_texts(texts)
+            self.vectorstore.add_embeddings(
+                list(zip(texts, vectors)),
+                metadatas=[doc.metadata for doc in documents]
+            )
             self.vectorstore.save_local(self.vector_db_path, index_name="faiss_index")
+            self.index_version += 1
             
             # 更新元数据
             self.document_metadata[file_path] = {
                 **result_info.get('metadata', {}),
                 'hash': doc_hash,
+                'size': stat_result.st_size,
+                'mtime_ns': stat_result.st_mtime_ns,
                 'last_processed': datetime.now().isoformat(),
                 'chunks': len(documents),
                 'processor_used': processor.name,
@@ -253,6 +285,28 @@ class EnhancedDocumentProcessor:
             logger.error(f"处理文档时出错: {file_path} - {e}")
             return False
     
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        分批并发计算文本向量，结果顺序与输入一致
+        
+        Args:
+            texts: 待向量化的文本
+            
+        Returns:
+            与texts一一对应的向量列表
+        """
+        batch_size = max(self.embed_batch_size, 1)
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        if len(batches) <= 1:
+            return self.embeddings.embed_documents(texts)
+        
+        # 按提交顺序取回结果，保证向量与文本对齐
+        futures = [self._embed_pool.submit(self.embeddings.embed_documents, batch) for batch in batches]
+        vectors = []
+        for future in futures:
+            vectors.extend(future.result())
+        return vectors
+    
     def process_all_documents(self) -> Tuple[int, int]:
         """
         处理目录中的所有支持的文档
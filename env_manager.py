@@ -4,7 +4,10 @@
 """
 
 import os
+import sys
 import logging
+import functools
+import threading
 from typing import Dict, Any, Optional, List
 from dotenv import load_dotenv, find_dotenv
 from config import DefaultConfig, SupportedOptions
@@ -13,13 +16,48 @@ from config import DefaultConfig, SupportedOptions
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 加载环境变量
-dotenv_path = find_dotenv(filename='.env', raise_error_if_not_found=False)
-if dotenv_path:
-    logger.info(f"从 {dotenv_path} 加载环境变量")
-    load_dotenv(dotenv_path)
-else:
-    logger.warning("未找到.env文件，仅使用系统环境变量")
+# 预先转为小写的支持选项，用于大小写不敏感的校验
+_CASE_INSENSITIVE_OPTIONS = {
+    "model_type": frozenset(t.lower() for t in SupportedOptions.MODEL_TYPES),
+    "vector_db": frozenset(db.lower() for db in SupportedOptions.VECTOR_DBS),
+    "search_tool": frozenset(tool.lower() for tool in SupportedOptions.SEARCH_TOOLS),
+}
+
+# API密钥预览的掩码部分
+_MASK = "****"
+
+
+def mask_api_key(api_key: Optional[str], visible: int = 5) -> str:
+    """
+    生成用于日志输出的API密钥预览
+    
+    Args:
+        api_key: API密钥
+        visible: 保留的前缀字符数
+    
+    Returns:
+        掩码后的密钥，未设置时返回"未设置"
+    """
+    if not api_key or len(api_key) <= visible:
+        return "未设置"
+    return f"{api_key[:visible]}{_MASK}"
+
+
+@functools.lru_cache(maxsize=1)
+def _load_env_once() -> str:
+    """
+    查找并加载.env文件（进程内只执行一次）
+    
+    Returns:
+        .env文件路径，未找到时为空字符串
+    """
+    dotenv_path = find_dotenv(filename='.env', raise_error_if_not_found=False)
+    if dotenv_path:
+        logger.info(f"从 {dotenv_path} 加载环境变量")
+        load_dotenv(dotenv_path)
+    else:
+        logger.warning("未找到.env文件，仅使用系统环境变量")
+    return dotenv_path
 
 
 class EnvManager:
@@ -27,6 +65,9 @@ class EnvManager:
     
     def __init__(self):
         """初始化环境变量管理器"""
+        # 首个实例触发.env加载
+        _load_env_once()
+        
         # 服务器配置
         self.server_port = int(os.getenv("PORT", DefaultConfig.DEFAULT_PORT))
         
@@ -40,9 +81,11 @@ class EnvManager:
         self.chunk_size = int(os.getenv("CHUNK_SIZE", DefaultConfig.DEFAULT_CHUNK_SIZE))
         self.chunk_overlap = int(os.getenv("CHUNK_OVERLAP", DefaultConfig.DEFAULT_CHUNK_OVERLAP))
         self.vector_db = os.getenv("VECTOR_DB", DefaultConfig.DEFAULT_VECTOR_DB)
+        self._vector_db_lc = sys.intern(self.vector_db.lower())
         
         # 搜索工具配置
         self.search_tool = os.getenv("SEARCH_TOOL", DefaultConfig.DEFAULT_SEARCH_TOOL)
+        self._search_tool_lc = sys.intern(self.search_tool.lower())
         self.tavily_api_key = os.getenv("TAVILY_API_KEY")
         self.serpapi_api_key = os.getenv("SERPAPI_API_KEY")
         
@@ -57,15 +100,14 @@ class EnvManager:
         results["model"] = bool(self.openai_api_key) and bool(self.openai_model)
         
         # 验证向量数据库配置（仅支持FAISS）
-        results["vector_db"] = (self.vector_db.lower() == "faiss")
+        results["vector_db"] = (self._vector_db_lc == "faiss")
         
-        # 验证搜索工具配置
-        if self.search_tool.lower() == "tavily":
-            results["search_tool"] = bool(self.tavily_api_key)
-        elif self.search_tool.lower() == "serpapi":
-            results["search_tool"] = bool(self.serpapi_api_key)
-        else:
-            results["search_tool"] = False
+        # 验证搜索工具配置（按工具类型查找对应的API密钥）
+        search_tool_key = {
+            "tavily": self.tavily_api_key,
+            "serpapi": self.serpapi_api_key
+        }.get(self._search_tool_lc)
+        results["search_tool"] = bool(search_tool_key)
         
         return results
     
@@ -81,14 +123,9 @@ class EnvManager:
     
     def validate_config_value(self, config_type: str, value: str) -> bool:
         """验证配置值是否有效"""
-        value_lower = value.lower()
-        
-        if config_type == "model_type":
-            return value_lower in [t.lower() for t in SupportedOptions.MODEL_TYPES]
-        elif config_type == "vector_db":
-            return value_lower in [db.lower() for db in SupportedOptions.VECTOR_DBS]
-        elif config_type == "search_tool":
-            return value_lower in [tool.lower() for tool in SupportedOptions.SEARCH_TOOLS]
+        options = _CASE_INSENSITIVE_OPTIONS.get(config_type)
+        if options is not None:
+            return value.lower() in options
         elif config_type == "openai_model":
             return value in SupportedOptions.OPENAI_MODELS
         elif config_type == "huggingface_model":
@@ -149,31 +186,32 @@ class EnvManager:
     def print_status(self) -> None:
         """打印环境变量配置状态"""
         logger.info("环境变量配置状态:")
-        logger.info(f"- 服务器端口: {self.server_port}")
-        logger.info(f"- 模型类型: {self.model_type}")
-        logger.info(f"- OpenAI模型: {self.openai_model}")
-        logger.info(f"- OpenAI API Key: {'已设置' if self.openai_api_key else '未设置'}")
-        logger.info(f"- 向量数据库类型: {self.vector_db}")
-        logger.info(f"- 向量数据库路径: {self.vector_db_path}")
-        logger.info(f"- 搜索工具: {self.search_tool}")
+        logger.info("- 服务器端口: %s", self.server_port)
+        logger.info("- 模型类型: %s", self.model_type)
+        logger.info("- OpenAI模型: %s", self.openai_model)
+        logger.info("- OpenAI API Key: %s", '已设置' if self.openai_api_key else '未设置')
+        logger.info("- 向量数据库类型: %s", self.vector_db)
+        logger.info("- 向量数据库路径: %s", self.vector_db_path)
+        logger.info("- 搜索工具: %s", self.search_tool)
         
         # 打印验证结果
         logger.info("验证结果:")
         for key, valid in self.validation_results.items():
             status = "通过" if valid else "失败"
-            logger.info(f"- {key}: {status}")
+            logger.info("- %s: %s", key, status)
         
         # 打印缺失配置
         missing = self.get_missing_configs()
         if missing:
             logger.warning("以下配置缺失或无效:")
             for item in missing:
-                logger.warning(f"- {item}")
+                logger.warning("- %s", item)
         else:
             logger.info("所有必要配置均已设置")
 
-# 创建全局环境变量管理器实例
-env_manager = EnvManager()
+# 全局环境变量管理器实例，首次获取时创建（届时才查找并加载.env文件）
+_env_manager_instance = None
+_env_manager_lock = threading.Lock()
 
 def get_env_manager() -> EnvManager:
     """
@@ -182,8 +220,13 @@ def get_env_manager() -> EnvManager:
     Returns:
         EnvManager实例
     """
-    return env_manager
+    global _env_manager_instance
+    if _env_manager_instance is None:
+        with _env_manager_lock:
+            if _env_manager_instance is None:
+                _env_manager_instance = EnvManager()
+    return _env_manager_instance
 
 # 在模块导入时输出配置状态
 if __name__ == "__main__":
-    env_manager.print_status() 
\ No newline at end of file
+    get_env_manager().print_status() 
\ No newline at end of file
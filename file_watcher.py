@@ -4,11 +4,14 @@
 """
 
 import os
+import sys
 import time
+import queue
 import logging
-from typing import Callable, Dict, Any, List, Optional
+import threading
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler, FileCreatedEvent, FileModifiedEvent, FileDeletedEvent
+from watchdog.events import EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED, FileSystemEventHandler
 
 # 导入文档处理器
 try:
@@ -40,18 +43,34 @@ class DocumentEventHandler(FileSystemEventHandler):
         
         Args:
             watch_dir: 监听的目录
-            processor_func: 文档处理函数
+            processor_func: 文档处理函数，处理失败时应抛出异常
         """
         self.watch_dir = watch_dir
         self.processor_func = processor_func
         
         # 防止重复处理的计时器
         self.last_processed = {}
+        # 已处理文件的 (大小, 修改时间) 签名
+        self.last_signatures = {}
         # 处理延迟（秒）：防止短时间内重复处理同一文件
         self.process_delay = 5
     
-    def dispatch(self, event):
-        """处理所有事件类型"""
+    def on_created(self, event):
+        """处理文件创建事件"""
+        self._handle_event(event)
+    
+    def on_modified(self, event):
+        """处理文件修改事件"""
+        self._handle_event(event)
+    
+    # 删除和移动事件暂不处理（由watchdog的默认分发直接忽略）
+    # 在将来的版本中可以考虑从向量数据库中删除相应的文档
+    
+    def _handle_event(self, event) -> None:
+        """处理创建或修改事件"""
+        if event.is_directory:
+            return
+        
         # 获取文件路径
         file_path = event.src_path
         
@@ -60,14 +79,19 @@ class DocumentEventHandler(FileSystemEventHandler):
             return
         
         # 检查是否需要处理该事件
-        if self._should_process(event):
-            # 记录处理时间
-            self.last_processed[file_path] = time.time()
-            # 调用处理函数
-            try:
-                self.processor_func(file_path)
-            except Exception as e:
-                logger.error(f"处理文件事件时出错: {file_path} - {e}")
+        signature = self._should_process(file_path)
+        if signature is None:
+            return
+        
+        # 记录处理时间
+        self.last_processed[file_path] = time.time()
+        # 调用处理函数，成功后才记录签名，失败的文件在下次事件时重新处理
+        try:
+            self.processor_func(file_path)
+        except Exception as e:
+            logger.error("处理文件事件时出错: %s - %s", file_path, e)
+        else:
+            self.last_signatures[file_path] = signature
     
     def _is_supported_file(self, file_path: str) -> bool:
         """检查是否为支持的文件格式"""
@@ -81,56 +105,142 @@ class DocumentEventHandler(FileSystemEventHandler):
         file_ext = os.path.splitext(file_path)[1].lower()
         return file_ext in supported_extensions
     
-    def _should_process(self, event) -> bool:
-        """判断事件是否需要处理"""
-        # 获取文件路径
-        file_path = event.src_path
+    def _should_process(self, file_path: str) -> Optional[Tuple[int, int]]:
+        """
+        判断创建或修改的文件是否需要处理
         
-        # 如果是创建或修改事件，且是支持的文件格式
-        if (isinstance(event, FileCreatedEvent) or isinstance(event, FileModifiedEvent)) \
-           and self._is_supported_file(file_path):
-            
-            # 检查文件是否存在（有些编辑器可能会触发虚假事件）
-            if not os.path.exists(file_path):
-                return False
-            
-            # 检查文件大小是否为0
-            try:
-                if os.path.getsize(file_path) == 0:
-                    return False
-            except Exception:
-                return False
-            
-            # 检查是否在短时间内重复处理
-            current_time = time.time()
-            last_time = self.last_processed.get(file_path, 0)
-            if current_time - last_time < self.process_delay:
-                logger.debug(f"跳过重复处理: {file_path}")
-                return False
-            
-            # 获取文件扩展名用于日志
+        Returns:
+            需要处理时返回文件的 (大小, 修改时间) 签名，否则返回None
+        """
+        # 先做纯内存的去重检查，避免对重复事件执行文件系统调用
+        current_time = time.time()
+        last_time = self.last_processed.get(file_path, 0)
+        if current_time - last_time < self.process_delay:
+            logger.debug("跳过重复处理: %s", file_path)
+            return None
+        
+        # 检查文件是否存在且大小不为0（有些编辑器可能会触发虚假事件）
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
+            return None
+        if stat_result.st_size == 0:
+            return None
+        
+        # 文件大小和修改时间均未变化时跳过
+        signature = (stat_result.st_size, stat_result.st_mtime_ns)
+        if self.last_signatures.get(file_path) == signature:
+            logger.debug("文件未变化，跳过处理: %s", file_path)
+            return None
+        
+        # 获取文件扩展名用于日志（仅在日志会输出时计算）
+        if logger.isEnabledFor(logging.INFO):
             file_ext = os.path.splitext(file_path)[1].lower()
-            logger.info(f"检测到 {file_ext} 文件变更: {file_path}")
-            return True
+            logger.info("检测到 %s 文件变更: %s", file_ext, file_path)
+        return signature
+
+# 参与合并并转发的事件类型（DocumentEventHandler只处理这两类）
+_COALESCED_EVENT_TYPES = frozenset((EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED))
+
+class CoalescingHandler(FileSystemEventHandler):
+    """
+    合并事件处理器，缓冲短时间内的文件事件并批量转发
+    
+    同一路径在一个合并窗口内的多个事件只保留最后一个，
+    由后台线程统一交给被包装的处理器处理。
+    """
+    
+    def __init__(self, handler: FileSystemEventHandler, debounce_ms: int = 100):
+        """
+        初始化合并事件处理器
+        
+        Args:
+            handler: 实际处理事件的处理器
+            debounce_ms: 合并窗口（毫秒）
+        """
+        self.handler = handler
+        self.debounce = debounce_ms / 1000
+        self._queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._worker = threading.Thread(
+            target=self._run,
+            name="file-watcher-coalescer",
+            daemon=True
+        )
+    
+    def start(self) -> None:
+        """启动后台合并线程"""
+        self._worker.start()
+    
+    def stop(self) -> None:
+        """停止后台合并线程，并处理剩余事件"""
+        self._stop_event.set()
+        self._worker.join()
+    
+    def dispatch(self, event):
+        """
+        缓冲文件的创建和修改事件，交由后台线程处理
+        
+        其他事件（目录事件、打开/关闭等）直接丢弃：inotify在写入文件后还会产生
+        FileClosedEvent，若参与合并会顶替掉同一路径的创建或修改事件。
+        """
+        if event.is_directory or event.event_type not in _COALESCED_EVENT_TYPES:
+            return
+        self._queue.put(event)
+    
+    def _run(self) -> None:
+        """按合并窗口周期性地批量处理事件"""
+        while not self._stop_event.wait(self.debounce):
+            self._flush()
+        self._flush()
+    
+    def _flush(self) -> None:
+        """取出当前缓冲的所有事件，按路径去重后转发"""
+        pending = {}
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            # 同一路径以最后一个事件为准
+            pending[event.src_path] = event
         
-        # 如果是删除事件，暂不处理
-        # 在将来的版本中可以考虑从向量数据库中删除相应的文档
-        return False
+        for event in pending.values():
+            try:
+                self.handler.dispatch(event)
+            except Exception as e:
+                logger.error("批量处理文件事件时出错: %s - %s", event.src_path, e)
+
+def _create_observer():
+    """
+    创建文件系统观察者
+    
+    Linux上直接使用inotify观察者，其他平台使用watchdog默认观察者
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            from watchdog.observers.inotify import InotifyObserver
+            return InotifyObserver()
+        except ImportError:
+            logger.warning("inotify观察者不可用，使用默认观察者")
+    return Observer()
 
 class FileWatcher:
     """
     文件监听器，监控目录中的文件变化
     """
     
-    def __init__(self, watch_dir: str = None):
+    def __init__(self, watch_dir: str = None, debounce_ms: int = 100):
         """
         初始化文件监听器
         
         Args:
             watch_dir: 监听的目录，默认为 'images'
+            debounce_ms: 事件合并窗口（毫秒）
         """
         # 设置监听目录
         self.watch_dir = watch_dir or 'images'
+        self.debounce_ms = debounce_ms
         
         # 确保目录存在
         if not os.path.exists(self.watch_dir):
@@ -146,6 +256,7 @@ class FileWatcher:
         # 初始化观察者
         self.observer = None
         self.event_handler = None
+        self.coalescing_handler = None
     
     def _process_document(self, file_path: str) -> None:
         """
@@ -154,19 +265,15 @@ class FileWatcher:
         Args:
             file_path: 文档路径
         """
-        logger.info(f"处理文档: {file_path}")
+        logger.info("处理文档: %s", file_path)
         
-        if self.document_processor:
-            try:
-                result = self.document_processor.process_document(file_path)
-                if result:
-                    logger.info(f"文档处理成功: {file_path}")
-                else:
-                    logger.warning(f"文档处理失败: {file_path}")
-            except Exception as e:
-                logger.error(f"处理文档时出错: {file_path} - {e}")
-        else:
-            logger.error("文档处理器不可用，无法处理文档")
+        # 处理失败时抛出异常，由事件处理器记录日志并在文件下次变化时重试
+        if not self.document_processor:
+            raise RuntimeError("文档处理器不可用，无法处理文档")
+        
+        if not self.document_processor.process_document(file_path):
+            raise RuntimeError("文档处理失败")
+        logger.info("文档处理成功: %s", file_path)
     
     def start(self) -> bool:
         """
@@ -180,18 +287,23 @@ class FileWatcher:
                 logger.warning("文件监听器已在运行")
                 return True
             
-            logger.info(f"启动文件监听器，监听目录: {self.watch_dir}")
+            logger.info("启动文件监听器，监听目录: %s", self.watch_dir)
             
             # 创建事件处理器
             self.event_handler = DocumentEventHandler(
                 watch_dir=self.watch_dir,
                 processor_func=self._process_document
             )
+            self.coalescing_handler = CoalescingHandler(
+                self.event_handler,
+                debounce_ms=self.debounce_ms
+            )
+            self.coalescing_handler.start()
             
             # 创建观察者
-            self.observer = Observer()
+            self.observer = _create_observer()
             self.observer.schedule(
-                self.event_handler,
+                self.coalescing_handler,
                 path=self.watch_dir,
                 recursive=True
             )
@@ -203,11 +315,14 @@ class FileWatcher:
             return True
         
         except Exception as e:
-            logger.error(f"启动文件监听器时出错: {e}")
+            logger.error("启动文件监听器时出错: %s", e)
             # 清理资源
             if self.observer:
                 self.observer.stop()
                 self.observer = None
+            if self.coalescing_handler:
+                self.coalescing_handler.stop()
+                self.coalescing_handler = None
             
             return False
     
@@ -223,10 +338,13 @@ class FileWatcher:
             self.observer.stop()
             self.observer.join()
             self.observer = None
+            if self.coalescing_handler:
+                self.coalescing_handler.stop()
+                self.coalescing_handler = None
             self.event_handler = None
             logger.info("文件监听器已停止")
         except Exception as e:
-            logger.error(f"停止文件监听器时出错: {e}")
+            logger.error("停止文件监听器时出错: %s", e)
     
     def is_running(self) -> bool:
         """
@@ -248,9 +366,9 @@ class FileWatcher:
         try:
             # 使用文档处理器的批处理功能
             success_count, total_count = self.document_processor.process_all_documents()
-            logger.info(f"已处理 {success_count}/{total_count} 个文档")
+            logger.info("已处理 %s/%s 个文档", success_count, total_count)
         except Exception as e:
-            logger.error(f"处理已存在文档时出错: {e}")
+            logger.error("处理已存在文档时出错: %s", e)
 
 # 单例模式
 _file_watcher_instance = None
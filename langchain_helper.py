@@ -4,14 +4,14 @@ LangChain助手模块，负责初始化LLM模型、链接组件并处理聊天
 
 import os
 import logging
-from dotenv import load_dotenv
+from collections import deque
 from typing import List, Dict, Any, Optional
 from abc import ABC, abstractmethod
 from config import DefaultConfig
+from env_manager import get_env_manager
 
 # LangChain导入
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 from langchain_core.language_models import BaseChatModel
@@ -21,9 +21,6 @@ from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 加载环境变量
-load_dotenv()
-
 # 默认系统提示词
 DEFAULT_SYSTEM_PROMPT = """
 你是一个画廊中的智能助手，能够回答关于艺术品和展示的PDF文档的问题。
@@ -44,6 +41,8 @@ class OpenAIModel(BaseLLMModel):
     """OpenAI模型"""
     
     def __init__(self, model_name: str = None, temperature: float = 0.7):
+        # 确保.env已加载
+        get_env_manager()
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.model_name = model_name or os.getenv("OPENAI_MODEL", DefaultConfig.DEFAULT_OPENAI_MODEL)
         self.temperature = temperature
@@ -67,10 +66,22 @@ class ChatHandler:
     
     def __init__(self):
         """初始化聊天处理器"""
+        # 确保.env已加载
+        get_env_manager()
         self.llm = self._init_llm()
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
         self.system_prompt = os.getenv("SYSTEM_PROMPT", DEFAULT_SYSTEM_PROMPT)
-        self.chat_history = []
+        # 上下文窗口按整轮对话（用户消息 + AI回复）滑动，消息数必须是非负偶数，0表示不带历史
+        max_context_messages = int(
+            os.getenv("MAX_CONTEXT_MESSAGES", DefaultConfig.DEFAULT_MAX_CONTEXT_MESSAGES)
+        )
+        self.max_context_messages = max(max_context_messages, 0) // 2 * 2
+        if self.max_context_messages != max_context_messages:
+            logger.warning(
+                "MAX_CONTEXT_MESSAGES应为非负偶数，已将 %s 调整为 %s",
+                max_context_messages, self.max_context_messages
+            )
+        self._system_msg = SystemMessage(content=self.system_prompt)
+        self.chat_history = deque(maxlen=self.max_context_messages)
         self._init_conversation()
     
     def _init_llm(self) -> BaseChatModel:
@@ -91,8 +102,8 @@ class ChatHandler:
         )
     
     def _init_conversation(self) -> None:
-        """初始化对话，设置系统提示词"""
-        self.chat_history = [SystemMessage(content=self.system_prompt)]
+        """初始化对话，系统提示词单独保存，不占用滑动窗口"""
+        self.chat_history.clear()
     
     def chat(self, user_message: str) -> str:
         """
@@ -105,14 +116,13 @@ class ChatHandler:
             AI的响应文本
         """
         try:
-            # 添加用户消息到历史
-            self.chat_history.append(HumanMessage(content=user_message))
+            human_message = HumanMessage(content=user_message)
             
-            # 获取AI响应
-            ai_message = self.llm.invoke(self.chat_history)
+            # 获取AI响应（系统提示 + 最近的上下文窗口 + 本次用户消息）
+            ai_message = self.llm.invoke([self._system_msg, *self.chat_history, human_message])
             
-            # 添加AI响应到历史
-            self.chat_history.append(ai_message)
+            # 用户消息和AI响应成对加入历史，窗口总是以完整的一轮对话开始
+            self.chat_history.extend((human_message, ai_message))
             
             return ai_message.content
         except Exception as e:
@@ -170,7 +180,8 @@ def create_chat_handler(model_type: str = None) -> ChatHandler:
         ChatHandler实例
     """
     if model_type is None:
-        # 从环境变量读取默认模型类型
+        # 从环境变量读取默认模型类型（先确保.env已加载）
+        get_env_manager()
         model_type = os.getenv("LLM_MODEL_TYPE", "openai")
     
     try:
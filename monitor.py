@@ -4,27 +4,86 @@
 """
 import psutil
 import time
+import queue
+import atexit
 import requests
 import logging
+import logging.handlers
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, Optional
 
-# 配置日志
+# 优先使用orjson进行JSON编解码，未安装时回退到标准库json
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    import json
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+# 配置日志：记录先放入队列，由后台线程写入文件和控制台，避免磁盘I/O阻塞监控循环
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler('monitor.log'),
+    logging.StreamHandler(sys.stdout)
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+# 记录已在放入队列时格式化为消息文本，只由监听线程中的处理器按完整格式输出一次
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('monitor.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
+    handlers=[_queue_handler]
 )
 logger = logging.getLogger(__name__)
 
+def _stop_log_listener():
+    """停止后台日志线程，写出队列中剩余的日志（可重复调用）"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+atexit.register(_stop_log_listener)
+
+# 单次检查（--once）时CPU使用率的采样时长（秒）：基线在创建监控器时记录，
+# 不等待的话首次采样只覆盖几毫秒，结果几乎没有意义
+ONCE_CPU_SAMPLE_INTERVAL = 0.5
+
 class SystemMonitor:
     """系统监控类"""
     
+    __slots__ = (
+        'server_url', 'check_interval', 'alert_thresholds', '_check_thresholds',
+        'consecutive_failures', 'max_consecutive_failures', 'last_alert_time', 'alert_cooldown',
+        'max_pending_alerts', '_pending_alerts', '_alerts_fp',
+        'connections_sample_every', '_tick', '_connections', '_connections_denied',
+        '_proc', '_mem_total_gb', '_disk_total_gb', '_http', '_executor',
+        '_meminfo_fd', '_stat_fd', '_last_cpu_times',
+    )
+    
+    # 监控只需要的会话统计字段
+    _SESSION_STATS_FIELDS = 'active_sessions,max_sessions'
+    
+    # 阈值告警检查表: (指标名, 阈值名, 告警键, 数据来源, 告警消息模板)
+    _CHECKS = (
+        ('cpu_percent', 'cpu_percent', 'high_cpu', 'system', "CPU使用率过高: {:.1f}%"),
+        ('memory_percent', 'memory_percent', 'high_memory', 'system', "内存使用率过高: {:.1f}%"),
+        ('disk_percent', 'disk_percent', 'high_disk', 'system', "磁盘使用率过高: {:.1f}%"),
+        ('active_sessions', 'max_sessions', 'high_sessions', 'app', "活跃会话数过多: {}"),
+        ('response_time', 'response_time', 'slow_response', 'app', "响应时间过长: {:.2f}秒"),
+    )
+    
     def __init__(self, server_url: str = "http://localhost:8000", check_interval: int = 30):
         self.server_url = server_url
         self.check_interval = check_interval
@@ -36,47 +95,171 @@ class SystemMonitor:
             'error_rate': 10.0,
             'response_time': 5.0  # 秒
         }
+        # 与_CHECKS对齐的阈值元组（修改alert_thresholds后需调用_refresh_check_thresholds）
+        self._refresh_check_thresholds()
         self.consecutive_failures = 0
         self.max_consecutive_failures = 3
         self.last_alert_time = {}
         self.alert_cooldown = 300  # 5分钟冷却期
         
-    def get_system_metrics(self) -> Dict:
+        # 待写入告警文件的JSON行（重复告警已由_should_alert的冷却期按告警类型抑制）。
+        # 写入失败时保留到下个检查周期重试，超过上限时丢弃最早的告警
+        self.max_pending_alerts = 1000
+        self._pending_alerts = []
+        self._alerts_fp = None
+        
+        # 网络连接数需要遍历全部套接字，开销较大，每隔若干次检查才采样一次
+        self.connections_sample_every = 10
+        self._tick = 0
+        self._connections = -1
+        self._connections_denied = False
+        
+        # 缓存当前进程句柄，避免每次采集都重新创建
+        self._proc = self._create_process_handle()
+        
+        # 内存和磁盘总量在运行期间不变，只计算一次
+        self._mem_total_gb = psutil.virtual_memory().total / 1024**3
+        self._disk_total_gb = psutil.disk_usage('/').total / 1024**3
+        
+        # Linux上直接读取/proc（文件描述符常驻），其他平台回退到psutil
+        self._meminfo_fd, self._stat_fd = self._open_proc_files()
+        self._last_cpu_times = (0, 0)
+        
+        # 预热系统CPU使用率基线，后续调用返回与上次调用之间的差值
+        self._read_cpu_percent()
+        
+        # 复用HTTP连接（keep-alive），避免每次检查都重新建立连接
+        self._http = requests.Session()
+        self._http.headers.update({'Connection': 'keep-alive'})
+        
+        # 应用指标的HTTP请求在后台线程执行，与本地系统采样并行
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="monitor-http")
+    
+    def _create_process_handle(self) -> psutil.Process:
+        """创建进程句柄，并预热cpu_percent基线"""
+        proc = psutil.Process()
+        proc.cpu_percent(interval=None)
+        return proc
+    
+    @staticmethod
+    def _open_proc_files():
+        """打开/proc/meminfo和/proc/stat，不可用时返回 (None, None)"""
+        if not sys.platform.startswith('linux'):
+            return None, None
+        try:
+            meminfo_fd = os.open('/proc/meminfo', os.O_RDONLY)
+        except OSError:
+            return None, None
+        try:
+            stat_fd = os.open('/proc/stat', os.O_RDONLY)
+        except OSError:
+            os.close(meminfo_fd)
+            return None, None
+        return meminfo_fd, stat_fd
+    
+    def _read_cpu_percent(self) -> float:
+        """读取系统CPU使用率（自上次调用以来）"""
+        if self._stat_fd is None:
+            return psutil.cpu_percent(interval=None)
+        
+        # 首行: cpu user nice system idle iowait irq softirq steal ...
+        line = os.pread(self._stat_fd, 4096, 0).split(b'\n', 1)[0]
+        fields = [int(value) for value in line.split()[1:9]]
+        total = sum(fields)
+        idle = fields[3] + fields[4]
+        
+        last_total, last_idle = self._last_cpu_times
+        self._last_cpu_times = (total, idle)
+        total_delta = total - last_total
+        if total_delta <= 0:
+            return 0.0
+        return round(100.0 * (total_delta - (idle - last_idle)) / total_delta, 1)
+    
+    def _read_memory(self):
+        """读取内存使用情况，返回 (使用率百分比, 已用字节数)"""
+        if self._meminfo_fd is None:
+            memory = psutil.virtual_memory()
+            return memory.percent, memory.used
+        
+        info = {}
+        for line in os.pread(self._meminfo_fd, 8192, 0).splitlines():
+            key, _, rest = line.partition(b':')
+            if rest:
+                info[key] = int(rest.split()[0]) * 1024  # kB -> 字节
+        
+        # 与psutil的计算方式保持一致
+        total = info[b'MemTotal']
+        free = info[b'MemFree']
+        buffers = info.get(b'Buffers', 0)
+        cached = info.get(b'Cached', 0) + info.get(b'SReclaimable', 0)
+        available = info.get(b'MemAvailable', free + buffers + cached)
+        used = total - free - buffers - cached
+        if used < 0:
+            used = total - free
+        return round((total - available) / total * 100, 1), used
+    
+    @staticmethod
+    def _read_disk(path: str = '/'):
+        """读取磁盘使用情况，返回 (使用率百分比, 已用字节数)"""
+        if not hasattr(os, 'statvfs'):
+            disk = psutil.disk_usage(path)
+            return disk.percent, disk.used
+        
+        st = os.statvfs(path)
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        avail = st.f_bavail * st.f_frsize
+        total_user = used + avail
+        percent = round(used / total_user * 100, 1) if total_user else 0.0
+        return percent, used
+        
+    def get_system_metrics(self, timestamp: Optional[str] = None) -> Dict:
         """获取系统资源指标"""
+        if timestamp is None:
+            timestamp = datetime.now().isoformat()
         try:
-            # CPU使用率
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU使用率（非阻塞，统计自上次采集以来的平均值）
+            cpu_percent = self._read_cpu_percent()
             
             # 内存使用情况
-            memory = psutil.virtual_memory()
+            memory_percent, memory_used = self._read_memory()
             
             # 磁盘使用情况
-            disk = psutil.disk_usage('/')
+            disk_percent, disk_used = self._read_disk('/')
             
-            # 网络连接数
-            try:
-                connections = len(psutil.net_connections())
-            except (psutil.AccessDenied, OSError):
-                connections = -1
+            # 网络连接数（按采样间隔刷新，无权限时不再尝试）
+            if not self._connections_denied and self._tick % self.connections_sample_every == 0:
+                try:
+                    self._connections = len(psutil.net_connections(kind='tcp'))
+                except psutil.AccessDenied:
+                    self._connections_denied = True
+                    self._connections = -1
+                except OSError:
+                    self._connections = -1
+            self._tick += 1
+            connections = self._connections
                 
             # 进程信息
             try:
-                current_process = psutil.Process()
-                process_memory = current_process.memory_info().rss / 1024 / 1024  # MB
-                process_cpu = current_process.cpu_percent()
+                process_memory = self._proc.memory_info().rss / 1024 / 1024  # MB
+                process_cpu = self._proc.cpu_percent(interval=None)
             except psutil.NoSuchProcess:
+                # 句柄失效时下次重新创建
+                try:
+                    self._proc = self._create_process_handle()
+                except psutil.Error:
+                    pass
                 process_memory = -1
                 process_cpu = -1
             
             return {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': timestamp,
                 'cpu_percent': cpu_percent,
-                'memory_percent': memory.percent,
-                'memory_used_gb': memory.used / 1024**3,
-                'memory_total_gb': memory.total / 1024**3,
-                'disk_percent': disk.percent,
-                'disk_used_gb': disk.used / 1024**3,
-                'disk_total_gb': disk.total / 1024**3,
+                'memory_percent': memory_percent,
+                'memory_used_gb': memory_used / 1024**3,
+                'memory_total_gb': self._mem_total_gb,
+                'disk_percent': disk_percent,
+                'disk_used_gb': disk_used / 1024**3,
+                'disk_total_gb': self._disk_total_gb,
                 'connections': connections,
                 'process_memory_mb': process_memory,
                 'process_cpu_percent': process_cpu
@@ -85,18 +268,25 @@ class SystemMonitor:
             logger.error(f"获取系统指标失败: {e}")
             return {}
     
-    def get_application_metrics(self) -> Dict:
+    def get_application_metrics(self, timestamp: Optional[str] = None) -> Dict:
         """获取应用程序指标"""
+        if timestamp is None:
+            timestamp = datetime.now().isoformat()
         try:
             start_time = time.time()
             
             # 获取会话统计
             try:
-                response = requests.get(f"{self.server_url}/api/session-stats", timeout=5)
+                # 只请求告警所需的计数字段，跳过逐会话详情的构建与解析
+                response = self._http.get(
+                    f"{self.server_url}/api/session-stats",
+                    params={'fields': self._SESSION_STATS_FIELDS},
+                    timeout=5
+                )
                 response_time = time.time() - start_time
                 
                 if response.status_code == 200:
-                    session_stats = response.json()
+                    session_stats = _json_loads(response.content)
                     app_available = True
                 else:
                     session_stats = {"active_sessions": -1}
@@ -119,62 +309,47 @@ class SystemMonitor:
                 health_status = "error"
             
             return {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': timestamp,
                 'app_available': app_available,
                 'response_time': response_time,
                 'active_sessions': session_stats.get('active_sessions', -1),
                 'max_sessions': session_stats.get('max_sessions', 50),
-                'health_status': health_status,
-                'session_details': session_stats.get('sessions', [])
+                'health_status': health_status
             }
         except Exception as e:
             logger.error(f"获取应用指标失败: {e}")
             return {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': timestamp,
                 'app_available': False,
                 'error': str(e)
             }
     
+    def _refresh_check_thresholds(self):
+        """按_CHECKS的顺序预先取出各项阈值"""
+        self._check_thresholds = tuple(
+            self.alert_thresholds[threshold_key] for _, threshold_key, _, _, _ in self._CHECKS
+        )
+    
     def check_alerts(self, system_metrics: Dict, app_metrics: Dict):
         """检查告警条件"""
-        current_time = time.time()
+        current_time = time.monotonic()
         alerts = []
         
-        # 系统资源告警
-        if system_metrics.get('cpu_percent', 0) > self.alert_thresholds['cpu_percent']:
-            alert_key = 'high_cpu'
-            if self._should_alert(alert_key, current_time):
-                alerts.append(f"CPU使用率过高: {system_metrics['cpu_percent']:.1f}%")
-        
-        if system_metrics.get('memory_percent', 0) > self.alert_thresholds['memory_percent']:
-            alert_key = 'high_memory'
-            if self._should_alert(alert_key, current_time):
-                alerts.append(f"内存使用率过高: {system_metrics['memory_percent']:.1f}%")
+        # 阈值告警（预先绑定各数据源的get方法，循环内只做一次查找）
+        getters = {'system': system_metrics.get, 'app': app_metrics.get}
+        for (metric_key, _, alert_key, source, message), threshold in zip(self._CHECKS, self._check_thresholds):
+            value = getters[source](metric_key, 0)
+            if value > threshold and self._should_alert(alert_key, current_time):
+                alerts.append(message.format(value))
         
-        if system_metrics.get('disk_percent', 0) > self.alert_thresholds['disk_percent']:
-            alert_key = 'high_disk'
-            if self._should_alert(alert_key, current_time):
-                alerts.append(f"磁盘使用率过高: {system_metrics['disk_percent']:.1f}%")
-        
-        # 应用程序告警
+        # 应用程序可用性告警
         if not app_metrics.get('app_available', False):
-            alert_key = 'app_down'
-            if self._should_alert(alert_key, current_time):
+            if self._should_alert('app_down', current_time):
                 alerts.append("应用程序不可用")
                 self.consecutive_failures += 1
         else:
             self.consecutive_failures = 0
         
-        if app_metrics.get('active_sessions', 0) > self.alert_thresholds['max_sessions']:
-            alert_key = 'high_sessions'
-            if self._should_alert(alert_key, current_time):
-                alerts.append(f"活跃会话数过多: {app_metrics['active_sessions']}")
-        
-        if app_metrics.get('response_time', 0) > self.alert_thresholds['response_time']:
-            alert_key = 'slow_response'
-            if self._should_alert(alert_key, current_time):
-                alerts.append(f"响应时间过长: {app_metrics['response_time']:.2f}秒")
-        
         # 连续失败告警
         if self.consecutive_failures >= self.max_consecutive_failures:
             alert_key = 'consecutive_failures'
@@ -184,14 +359,15 @@ class SystemMonitor:
         return alerts
     
     def _should_alert(self, alert_key: str, current_time: float) -> bool:
-        """检查是否应该发送告警（考虑冷却期）"""
-        last_alert = self.last_alert_time.get(alert_key, 0)
+        """检查是否应该发送告警（考虑冷却期，时间基于time.monotonic）"""
+        # 单调时钟的起点不确定，未告警过时使用负无穷，保证首次告警不被冷却期拦截
+        last_alert = self.last_alert_time.get(alert_key, float('-inf'))
         if current_time - last_alert > self.alert_cooldown:
             self.last_alert_time[alert_key] = current_time
             return True
         return False
     
-    def send_alerts(self, alerts: list):
+    def send_alerts(self, alerts: list, timestamp: Optional[str] = None):
         """发送告警（可以扩展为邮件、钉钉等）"""
         if alerts:
             logger.warning("🚨 系统告警:")
@@ -204,41 +380,69 @@ class SystemMonitor:
             # - 短信告警
             # - 写入告警文件
             
-            # 写入告警文件
-            try:
-                with open('alerts.log', 'a', encoding='utf-8') as f:
-                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    for alert in alerts:
-                        f.write(f"{timestamp} - {alert}\n")
-            except Exception as e:
-                logger.error(f"写入告警文件失败: {e}")
+            # 本批告警（连同之前写入失败的告警）一次性写入告警文件，每条告警为一行JSON
+            if timestamp is None:
+                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for alert in alerts:
+                self._pending_alerts.append(_json_dumps({'ts': timestamp, 'alert': alert}) + b'\n')
+            self._flush_alerts()
+    
+    def _flush_alerts(self):
+        """将待写入的告警一次性写入告警文件，写入失败时保留待下次重试"""
+        if not self._pending_alerts:
+            return
+        
+        try:
+            if self._alerts_fp is None:
+                self._alerts_fp = open('alerts.log', 'ab', buffering=8192)
+            self._alerts_fp.writelines(self._pending_alerts)
+            self._alerts_fp.flush()
+        except Exception as e:
+            logger.error(f"写入告警文件失败，将在下个检查周期重试: {e}")
+            # 文件可能已损坏，下次重新打开
+            if self._alerts_fp is not None:
+                try:
+                    self._alerts_fp.close()
+                except Exception:
+                    pass
+                self._alerts_fp = None
+            overflow = len(self._pending_alerts) - self.max_pending_alerts
+            if overflow > 0:
+                del self._pending_alerts[:overflow]
+            return
+        self._pending_alerts.clear()
     
     def log_metrics(self, system_metrics: Dict, app_metrics: Dict):
         """记录指标日志"""
         # 系统指标
         if system_metrics:
+            get = system_metrics.get
             logger.info(
-                f"系统状态 - CPU: {system_metrics.get('cpu_percent', 0):.1f}%, "
-                f"内存: {system_metrics.get('memory_percent', 0):.1f}%, "
-                f"磁盘: {system_metrics.get('disk_percent', 0):.1f}%"
+                "系统状态 - CPU: %.1f%%, 内存: %.1f%%, 磁盘: %.1f%%",
+                get('cpu_percent', 0), get('memory_percent', 0), get('disk_percent', 0)
             )
         
         # 应用指标
         if app_metrics:
-            status = "正常" if app_metrics.get('app_available', False) else "异常"
+            get = app_metrics.get
+            status = "正常" if get('app_available', False) else "异常"
             logger.info(
-                f"应用状态 - 状态: {status}, "
-                f"活跃会话: {app_metrics.get('active_sessions', 0)}, "
-                f"响应时间: {app_metrics.get('response_time', 0):.2f}s"
+                "应用状态 - 状态: %s, 活跃会话: %s, 响应时间: %.2fs",
+                status, get('active_sessions', 0), get('response_time', 0)
             )
     
     def run_once(self):
         """执行一次监控检查"""
         logger.debug("开始监控检查...")
         
-        # 获取指标
-        system_metrics = self.get_system_metrics()
-        app_metrics = self.get_application_metrics()
+        # 本次检查统一使用同一个时间戳
+        now = datetime.now()
+        iso_timestamp = now.isoformat()
+        
+        # 获取指标（HTTP请求与系统采样并行执行）
+        app_future = self._executor.submit(self.get_application_metrics, iso_timestamp)
+        system_metrics = self.get_system_metrics(iso_timestamp)
+        app_metrics = app_future.result()
         
         # 记录日志
         self.log_metrics(system_metrics, app_metrics)
@@ -246,7 +450,10 @@ class SystemMonitor:
         # 检查告警
         alerts = self.check_alerts(system_metrics, app_metrics)
         if alerts:
-            self.send_alerts(alerts)
+            self.send_alerts(alerts, now.strftime('%Y-%m-%d %H:%M:%S'))
+        else:
+            # 重试之前写入失败的告警
+            self._flush_alerts()
         
         return {
             'system': system_metrics,
@@ -274,7 +481,26 @@ class SystemMonitor:
         except Exception as e:
             logger.error(f"监控程序异常退出: {e}")
         finally:
+            self.close()
             logger.info("监控程序已停止")
+            _stop_log_listener()
+    
+    def close(self):
+        """释放监控器持有的资源"""
+        self._executor.shutdown(wait=True)
+        self._http.close()
+        
+        # 关闭常驻的/proc文件描述符
+        for fd in (self._meminfo_fd, self._stat_fd):
+            if fd is not None:
+                os.close(fd)
+        self._meminfo_fd = self._stat_fd = None
+        
+        # 写入剩余告警并关闭告警文件
+        self._flush_alerts()
+        if self._alerts_fp is not None:
+            self._alerts_fp.close()
+            self._alerts_fp = None
 
 def main():
     """主函数"""
@@ -289,7 +515,11 @@ def main():
     if len(sys.argv) > 1:
         if sys.argv[1] == '--once':
             # 执行一次检查
-            result = monitor.run_once()
+            try:
+                time.sleep(ONCE_CPU_SAMPLE_INTERVAL)
+                result = monitor.run_once()
+            finally:
+                monitor.close()
             print("监控结果:")
             print(f"系统指标: {result['system']}")
             print(f"应用指标: {result['application']}")
@@ -0,0 +1,126 @@
+"""
+并行工具调用代理模块
+模型在同一轮中请求多个可并发的工具时，并行执行这些工具调用
+"""
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Union
+from uuid import UUID
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+from langchain_core.callbacks import BaseCallbackHandler, CallbackManagerForChainRun
+from langchain_core.tools import BaseTool
+
+logger = logging.getLogger(__name__)
+
+# 工具metadata中的标记，表示该工具只读、可与其他工具同时执行
+CONCURRENCY_SAFE = "concurrency_safe"
+
+# 所有代理共享的工具线程池
+_tool_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="agent-tool")
+
+# 当前线程中已提前提交的工具调用（按AgentAction的id索引）
+_local = threading.local()
+
+def _pending_futures() -> Dict[int, Future]:
+    """获取当前线程的待取结果表"""
+    futures = getattr(_local, "futures", None)
+    if futures is None:
+        futures = _local.futures = {}
+    return futures
+
+def is_concurrency_safe(tool: Optional[BaseTool]) -> bool:
+    """
+    判断工具是否可以并发执行
+
+    Args:
+        tool: 工具实例
+
+    Returns:
+        工具metadata中带有并发安全标记时返回True
+    """
+    return bool(tool is not None and tool.metadata and tool.metadata.get(CONCURRENCY_SAFE))
+
+class AgentDebugCallbackHandler(BaseCallbackHandler):
+    """
+    以DEBUG日志记录代理执行过程，替代verbose=True的标准输出打印
+
+    每次执行的步骤先缓存在内存中，结束时合并为一条日志输出，
+    并发查询的记录不会互相穿插。
+    """
+
+    def __init__(self):
+        self._traces: Dict[UUID, List[str]] = {}
+
+    def on_agent_action(self, action: AgentAction, *, run_id: UUID, **kwargs: Any) -> None:
+        self._traces.setdefault(run_id, []).append(
+            f"调用工具 {action.tool}，输入: {action.tool_input}"
+        )
+
+    def on_agent_finish(self, finish: AgentFinish, *, run_id: UUID, **kwargs: Any) -> None:
+        steps = self._traces.pop(run_id, [])
+        steps.append(f"完成: {finish.return_values.get('output', '')}")
+        logger.debug("代理执行过程:\n%s", "\n".join(steps))
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        steps = self._traces.pop(run_id, None)
+        if steps is not None:
+            steps.append(f"出错: {error}")
+            logger.debug("代理执行过程:\n%s", "\n".join(steps))
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    支持并行工具调用的代理执行器
+
+    AgentExecutor在同一轮中依次执行模型请求的所有工具。
+    这里在模型给出第二个可并发的工具调用时，把已给出的可并发调用提交到线程池，
+    之后按原顺序取回结果，工具结果的顺序与串行执行时一致。
+    """
+
+    def _iter_next_step(
+        self,
+        name_to_tool_map: Dict[str, BaseTool],
+        color_mapping: Dict[str, str],
+        inputs: Dict[str, str],
+        intermediate_steps: List[tuple],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Iterator[Union[AgentFinish, AgentAction, AgentStep]]:
+        pending = _pending_futures()
+        safe_actions = []
+        submitted = 0
+        try:
+            for item in super()._iter_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+            ):
+                if isinstance(item, AgentAction) and is_concurrency_safe(name_to_tool_map.get(item.tool)):
+                    safe_actions.append(item)
+                    # 只有一个工具调用时直接串行执行，避免额外的线程切换
+                    if len(safe_actions) >= 2:
+                        for action in safe_actions[submitted:]:
+                            pending[id(action)] = _tool_executor.submit(
+                                contextvars.copy_context().run,
+                                AgentExecutor._perform_agent_action,
+                                self, name_to_tool_map, color_mapping, action, run_manager
+                            )
+                        submitted = len(safe_actions)
+                yield item
+        finally:
+            for action in safe_actions:
+                pending.pop(id(action), None)
+        if submitted:
+            logger.info("并行执行了 %s 个工具调用", submitted)
+
+    def _perform_agent_action(
+        self,
+        name_to_tool_map: Dict[str, BaseTool],
+        color_mapping: Dict[str, str],
+        agent_action: AgentAction,
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> AgentStep:
+        future = _pending_futures().pop(id(agent_action), None)
+        if future is not None:
+            return future.result()
+        return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
@@ -4,58 +4,113 @@ RAG链模块
 """
 
 import os
+import re
 import logging
+import functools
 import threading
-from typing import List, Dict, Any, Optional, Union, Tuple
-
-# LangChain导入
-from langchain.chains import ConversationalRetrievalChain
-from langchain.prompts import PromptTemplate
-from langchain.agents import AgentExecutor, create_tool_calling_agent
-from langchain.agents.agent_toolkits import create_retriever_tool
-from langchain.tools import tool
-# 修正导入路径
-from langchain_community.tools.tavily_search.tool import TavilySearchResults
-# 修改导入方式，避免vectorstores.base导入错误
-try:
-    from langchain_community.vectorstores.base import VectorStore
-except ImportError:
-    # 定义一个替代基类
-    from typing import Protocol, runtime_checkable
-    
-    @runtime_checkable
-    class VectorStore(Protocol):
-        """用于替代向量存储的协议类"""
-        def as_retriever(self, **kwargs):
-            """获取检索器"""
-            ...
-from langchain_core.documents import Document
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, BaseMessage
-from langchain_core.tools import Tool
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-
-# 导入自定义模块
-try:
-    from document_processor import get_document_processor
-    from langchain_helper import create_chat_handler
-    from env_manager import get_env_manager
-    from search_tools import get_search_tool
-    
-    has_dependencies = True
-    document_processor = get_document_processor()
-    env_manager = get_env_manager()
-    search_tool = get_search_tool()
-except ImportError as e:
-    print(f"警告: 无法导入必要的模块: {e}")
-    has_dependencies = False
-    document_processor = None
-    env_manager = None
-    search_tool = None
+from collections import deque
+from typing import List, Dict, Any, Iterator, Optional, Union, Tuple, TYPE_CHECKING
+from config import DefaultConfig
+
+# LangChain导入较慢，运行时按需在函数内导入，这里仅用于类型注解
+if TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain_core.messages import BaseMessage
+    from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+    from langchain_core.tools import Tool
+    from langchain_core.vectorstores import VectorStore
+
+# 自定义模块（langchain_helper会导入LangChain），在首次创建RAG链时才加载
+has_dependencies = False
+document_processor = None
+env_manager = None
+create_chat_handler = None
+_deps_loaded = False
+_deps_lock = threading.Lock()
+
+# 尚未创建的惰性属性标记
+_UNSET = object()
+
+# 代理执行过程默认不打印到标准输出（并发查询时会争用stdout），需要时设置RAG_VERBOSE=1，
+# 或将日志级别设为DEBUG以日志形式记录
+RAG_VERBOSE = os.getenv("RAG_VERBOSE", "0") == "1"
+
+def _load_dependencies() -> bool:
+    """
+    按需导入RAG链依赖的自定义模块，只在首次调用时执行
+    
+    Returns:
+        依赖是否全部可用
+    """
+    global has_dependencies, document_processor, env_manager, create_chat_handler, _deps_loaded
+    if _deps_loaded:
+        return has_dependencies
+    
+    with _deps_lock:
+        if _deps_loaded:
+            return has_dependencies
+        try:
+            from document_processor import get_document_processor
+            from langchain_helper import create_chat_handler as _create_chat_handler
+            from env_manager import get_env_manager
+            
+            document_processor = get_document_processor()
+            env_manager = get_env_manager()
+            create_chat_handler = _create_chat_handler
+            has_dependencies = True
+        except ImportError as e:
+            print(f"警告: 无法导入必要的模块: {e}")
+            has_dependencies = False
+        _deps_loaded = True
+    return has_dependencies
 
 # 日志配置
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 提示需要最新信息的关键词（命中时强制使用互联网搜索，且不使用语义缓存）
+_LATEST_INFO_KEYWORDS = (
+    '最新', '2024', '2025', '当前', '现在', '趋势', '发展', '近期', '最近',
+    '今年', '今天', '最新动态', '最新消息', '最新情况', '实时', '最新版本'
+)
+
+# 关键词均为中文或数字，大小写无关，合并为一个正则后一次扫描即可
+_LATEST_INFO_RE = re.compile("|".join(map(re.escape, _LATEST_INFO_KEYWORDS)))
+
+def _needs_latest_info(query: str) -> bool:
+    """判断查询是否涉及最新信息或时间敏感内容"""
+    return _LATEST_INFO_RE.search(query) is not None
+
+# 文档检索工具输出中的页码标记（如"第3页"）
+_PAGE_RE = re.compile(r"第[^页]{0,32}页")
+# 由工具输出字符串构建的文档的元数据（Document校验时会复制，可安全共享）
+_DOC_SEARCH_METADATA = {"source": "document_search"}
+
+# 消息类型到对外展示角色的映射
+_ROLE_MAP = {"human": "user", "ai": "assistant", "system": "system"}
+
+def _format_message(message: "BaseMessage") -> Dict[str, str]:
+    """将消息转换为包含角色和内容的字典"""
+    role = _ROLE_MAP.get(getattr(message, "type", None))
+    if role is None:
+        return {"role": "unknown", "content": str(message)}
+    return {"role": role, "content": message.content}
+
+# 代理处理流程说明：涉及最新信息的问题，强调必须进行互联网搜索
+# （说明预先填入系统提示，两类问题各自的提示前缀在多次调用间保持不变，便于模型服务端缓存）
+LATEST_INFO_INSTRUCTIONS = """重要提示：这个问题涉及最新信息或时间敏感内容。请按照以下流程处理：
+1. 首先使用document_search工具搜索本地文档
+2. 然后必须使用internet_search工具获取最新信息
+3. 结合两个来源的信息提供完整答案
+
+即使本地文档有相关信息，也要通过互联网搜索获取最新补充信息！"""
+
+# 代理处理流程说明：一般问题，本地文档不足时再使用互联网搜索
+DEFAULT_INSTRUCTIONS = """请按照以下流程处理：
+1. 首先使用document_search工具搜索本地文档数据库
+2. 如果本地文档信息不完整或没有相关信息，请使用internet_search工具补充"""
+
 # 默认提示模板
 DEFAULT_CONDENSE_QUESTION_TEMPLATE = """
 根据对话历史和最新问题，生成一个独立的问题。
@@ -105,28 +160,106 @@ SYSTEM_PROMPT = """你是画廊中的智能助手，能够回答关于PDF文档
 - 如果使用了互联网搜索，要说明"为了提供最新信息，我还搜索了互联网"
 """
 
-# 工具调用代理模板 - 修复缺少的agent_scratchpad变量
-AGENT_PROMPT = ChatPromptTemplate.from_messages(
-    [
-        ("system", SYSTEM_PROMPT),
-        ("user", "{input}"),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
-    ]
-)
+def reload_env() -> None:
+    """重新读取搜索服务配置，之后创建的RAG链实例使用新的配置"""
+    from search_tools import reset_search_tools
+    
+    reset_search_tools()
+
+def _internet_search(query: str) -> str:
+    """
+    互联网搜索工具的执行函数，结果格式化为文本交给代理
+    
+    Args:
+        query: 搜索查询
+    
+    Returns:
+        每条结果的标题、链接和摘要，没有结果时返回提示文本
+    """
+    from search_tools import search_with_fallback
+    
+    results = search_with_fallback(query)
+    if not results:
+        return "没有找到相关的互联网搜索结果"
+    return "\n\n".join(
+        f"{result.get('title', '')}\n{result.get('url', '')}\n{result.get('content', '')}"
+        for result in results
+    )
+
+@functools.lru_cache(maxsize=1)
+def get_condense_question_prompt() -> "PromptTemplate":
+    """
+    获取问题压缩模板（首次调用时创建）
+    
+    Returns:
+        由对话历史生成独立问题的提示模板
+    """
+    from langchain.prompts import PromptTemplate
+    
+    return PromptTemplate.from_template(DEFAULT_CONDENSE_QUESTION_TEMPLATE)
+
+@functools.lru_cache(maxsize=1)
+def get_qa_prompt() -> "PromptTemplate":
+    """
+    获取问答模板（首次调用时创建）
+    
+    Returns:
+        基于检索上下文回答问题的提示模板
+    """
+    from langchain.prompts import PromptTemplate
+    
+    return PromptTemplate.from_template(DEFAULT_QA_TEMPLATE)
+
+@functools.lru_cache(maxsize=2)
+def get_agent_prompt(latest_info: bool = False) -> "ChatPromptTemplate":
+    """
+    获取工具调用代理模板（首次调用时创建）
+    
+    Args:
+        latest_info: 是否为涉及最新信息的问题，决定预先填入系统提示的处理流程说明
+    
+    Returns:
+        包含chat_history和agent_scratchpad变量的聊天提示模板
+    """
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", SYSTEM_PROMPT + "\n{workflow_instructions}"),
+            MessagesPlaceholder(variable_name="chat_history", optional=True),
+            ("user", "用户问题: {input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ]
+    )
+    return prompt.partial(
+        workflow_instructions=LATEST_INFO_INSTRUCTIONS if latest_info else DEFAULT_INSTRUCTIONS
+    )
 
 class RAGChain:
     """
     RAG链，整合文档检索和聊天功能
     """
     
-    def __init__(self, vectorstore: Optional[VectorStore] = None, model_type: str = "openai"):
+    __slots__ = (
+        'resource_manager', 'vectorstore', '_retriever', 'semantic_cache', 'embeddings',
+        'model_type', 'chat_handler', 'llm',
+        '_history_turns', 'chat_history', '_history_pairs', '_pending_human', '_formatted_history',
+        '_lock', '_history_lock', 'condense_question_prompt', 'qa_prompt', 'tools', 'agent_executor', '_latest_agent_executor', '_chain',
+    )
+    
+    def __init__(self, vectorstore: Optional["VectorStore"] = None, model_type: str = "openai",
+                 history_turns: Optional[int] = None):
         """
         初始化RAG链 - 支持独立实例
         
         Args:
             vectorstore: 向量数据库实例
             model_type: 使用的模型类型 ("openai" 或 "huggingface")
+            history_turns: 保留的最近对话轮数，默认读取HISTORY_TURNS环境变量
         """
+        # 首次创建时加载依赖模块
+        _load_dependencies()
+        
         # 获取资源管理器
         try:
             from resource_manager import get_resource_manager
@@ -146,6 +279,24 @@ class RAGChain:
         else:
             self.vectorstore = vectorstore
         
+        # 文档检索工具和备用RAG链共用同一个检索器
+        if self.vectorstore:
+            self._retriever = self.vectorstore.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": 5}
+            )
+        else:
+            self._retriever = None
+        
+        # 语义缓存（所有实例共享），使用与文档向量库相同的嵌入模型
+        try:
+            from semantic_cache import get_semantic_cache
+            self.semantic_cache = get_semantic_cache()
+        except ImportError:
+            logger.warning("无法导入语义缓存模块，跳过语义缓存")
+            self.semantic_cache = None
+        self.embeddings = getattr(document_processor, 'embeddings', None)
+        
         # 模型类型
         if env_manager and env_manager.model_type:
             self.model_type = env_manager.model_type
@@ -154,96 +305,132 @@ class RAGChain:
         
         # 初始化聊天处理器
         try:
+            if create_chat_handler is None:
+                raise RuntimeError("langchain_helper模块不可用")
             self.chat_handler = create_chat_handler(self.model_type)
             self.llm = self.chat_handler.llm
-            logger.info(f"已初始化聊天处理器，使用模型类型: {self.model_type}")
+            logger.info("已初始化聊天处理器，使用模型类型: %s", self.model_type)
         except Exception as e:
             self.chat_handler = None
             self.llm = None
-            logger.error(f"初始化聊天处理器失败: {e}")
-        
-        # 每个实例独立的聊天历史
-        self.chat_history = []
-        
-        # 实例级别的线程锁
+            logger.error("初始化聊天处理器失败: %s", e)
+        
+        # 每个实例独立的聊天历史（只保留最近的若干轮对话）
+        if history_turns is None:
+            history_turns = int(os.getenv("HISTORY_TURNS", DefaultConfig.DEFAULT_HISTORY_TURNS))
+        self._history_turns = history_turns
+        self.chat_history = deque(maxlen=self._history_turns * 2)
+        # 与chat_history同步维护的 (用户消息, AI回复) 对，避免每次查询重新扫描历史
+        self._history_pairs = deque(maxlen=self._history_turns)
+        # 逐条添加消息时，等待AI回复配对的用户消息
+        self._pending_human: Optional[str] = None
+        # 与chat_history同步维护的展示用历史
+        self._formatted_history = deque(maxlen=self._history_turns * 2)
+        
+        # 实例级别的线程锁（串行化查询）
         self._lock = threading.Lock()
+        # 保护聊天历史的短锁，只在读写历史时持有，不会被正在执行的查询阻塞
+        self._history_lock = threading.Lock()
         
-        # 提示模板
-        self.condense_question_prompt = PromptTemplate.from_template(
-            DEFAULT_CONDENSE_QUESTION_TEMPLATE
-        )
-        self.qa_prompt = PromptTemplate.from_template(
-            DEFAULT_QA_TEMPLATE
-        )
+        # 提示模板（所有实例共享）
+        self.condense_question_prompt = get_condense_question_prompt()
+        self.qa_prompt = get_qa_prompt()
         
         # 初始化工具和代理
         self.tools = self._init_tools()
         self.agent_executor = self._init_agent()
+        # 涉及最新信息的问题使用单独的代理，系统提示中要求必须进行互联网搜索
+        self._latest_agent_executor = self._init_agent(latest_info=True) if self.agent_executor else None
         
-        # 备用RAG链 (如果工具调用不可用)
-        self.chain = self._init_chain()
+        # 备用RAG链 (如果工具调用不可用)，首次回退到传统RAG时才创建
+        self._chain = _UNSET
         
-        logger.info(f"RAG链实例初始化完成: {id(self)}")
+        logger.info("RAG链实例初始化完成: %s", id(self))
+    
+    def _init_tools(self) -> List["Tool"]:
+        """
+        初始化工具集合
+        """
+        retriever_tool = self._build_retriever_tool()
+        internet_tool = self._build_internet_tool()
+        return [tool for tool in (retriever_tool, internet_tool) if tool]
     
-    def _init_tools(self) -> List[Tool]:
-        """初始化工具集合"""
-        tools = []
+    def _build_retriever_tool(self) -> Optional["Tool"]:
+        """
+        创建文档检索工具
         
-        # 添加文档检索工具
-        if self.vectorstore:
-            retriever = self.vectorstore.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": 5}
-            )
-            
-            retriever_tool = create_retriever_tool(
-                retriever=retriever,
-                name="document_search",
-                description="""【优先使用】搜索本地PDF文档库。这是主要的信息来源，包含所有已上传的PDF文档内容。
-                对于任何问题，都应该首先使用此工具搜索本地文档数据库，包括但不限于：
-                - 文档内容、概念解释
-                - 技术规格、产品信息  
-                - 历史信息、背景资料
-                - 任何可能在文档中出现的信息
-                务必优先使用此工具！"""
-            )
-            tools.append(retriever_tool)
+        Returns:
+            文档检索工具，没有检索器时返回None
+        """
+        from langchain.agents.agent_toolkits import create_retriever_tool
+        from parallel_agent import CONCURRENCY_SAFE
+        
+        if not self._retriever:
+            return None
+        
+        retriever_tool = create_retriever_tool(
+            retriever=self._retriever,
+            name="document_search",
+            description="""【优先使用】搜索本地PDF文档库。这是主要的信息来源，包含所有已上传的PDF文档内容。
+            对于任何问题，都应该首先使用此工具搜索本地文档数据库，包括但不限于：
+            - 文档内容、概念解释
+            - 技术规格、产品信息  
+            - 历史信息、背景资料
+            - 任何可能在文档中出现的信息
+            务必优先使用此工具！"""
+        )
+        # 文档检索只读本地向量库，可与互联网搜索并行执行
+        retriever_tool.metadata = {CONCURRENCY_SAFE: True}
+        return retriever_tool
+    
+    def _build_internet_tool(self) -> Optional["Tool"]:
+        """
+        创建互联网搜索工具
+        
+        Returns:
+            互联网搜索工具，未配置API密钥或创建失败时返回None
+        """
+        from langchain_core.tools import Tool
+        from parallel_agent import CONCURRENCY_SAFE
+        from search_tools import get_search_tools
         
-        # 添加网络搜索工具
         try:
-            # 获取API密钥
-            tavily_api_key = os.getenv("TAVILY_API_KEY", "")
-            if env_manager:
-                tavily_api_key = env_manager.tavily_api_key or tavily_api_key
+            # 搜索工具按配置的首选服务排序，结果缓存和失败重试由search_tools处理
+            if not get_search_tools():
+                logger.warning("未配置Tavily或SerpAPI API Key，无法创建互联网搜索工具")
+                return None
             
-            if tavily_api_key:
-                search_tool = TavilySearchResults(api_key=tavily_api_key)
-                tools.append(
-                    Tool(
-                        name="internet_search",
-                        func=search_tool.invoke,
-                        description="""搜索互联网获取最新信息和实时数据。
-                        
-                        使用情况：
-                        - 已经使用document_search搜索过本地文档后
-                        - 本地文档没有相关信息或信息不完整
-                        - 问题涉及最新信息、实时数据、当前趋势、最新发展等
-                        - 需要补充最新的行业动态、新闻、技术发展等
-                        
-                        特别适用于包含"最新"、"2024"、"当前"、"趋势"、"发展"等关键词的问题。""",
-                        return_direct=False
-                    )
-                )
-                logger.info("成功创建Tavily搜索工具")
-            else:
-                logger.warning("未配置Tavily API Key，无法创建互联网搜索工具")
+            internet_tool = Tool(
+                name="internet_search",
+                func=_internet_search,
+                description="""搜索互联网获取最新信息和实时数据。
+                
+                使用情况：
+                - 已经使用document_search搜索过本地文档后
+                - 本地文档没有相关信息或信息不完整
+                - 问题涉及最新信息、实时数据、当前趋势、最新发展等
+                - 需要补充最新的行业动态、新闻、技术发展等
+                
+                特别适用于包含"最新"、"2024"、"当前"、"趋势"、"发展"等关键词的问题。""",
+                return_direct=False,
+                metadata={CONCURRENCY_SAFE: True}
+            )
+            logger.info("成功创建互联网搜索工具")
+            return internet_tool
         except Exception as e:
-            logger.error(f"创建Tavily搜索工具失败: {e}")
-        
-        return tools
+            logger.error("创建互联网搜索工具失败: %s", e)
+            return None
     
-    def _init_agent(self) -> Optional[AgentExecutor]:
-        """初始化代理执行器"""
+    def _init_agent(self, latest_info: bool = False) -> Optional["AgentExecutor"]:
+        """
+        初始化代理执行器
+        
+        Args:
+            latest_info: 是否为涉及最新信息的问题创建代理
+        
+        Returns:
+            代理执行器，创建失败时返回None
+        """
         if not self.llm:
             logger.error("LLM未初始化，无法创建代理")
             return None
@@ -253,28 +440,39 @@ class RAGChain:
             return None
         
         try:
+            from langchain.agents import create_tool_calling_agent
+            from parallel_agent import AgentDebugCallbackHandler, ParallelAgentExecutor
+            
             # 创建代理
             agent = create_tool_calling_agent(
                 llm=self.llm,
                 tools=self.tools,
-                prompt=AGENT_PROMPT
+                prompt=get_agent_prompt(latest_info)
             )
             
-            # 创建代理执行器
-            agent_executor = AgentExecutor(
+            # 创建代理执行器（同一轮中的多个只读工具调用并行执行）
+            agent_executor = ParallelAgentExecutor(
                 agent=agent, 
                 tools=self.tools,
-                verbose=True,
+                verbose=RAG_VERBOSE,
+                callbacks=[AgentDebugCallbackHandler()] if logger.isEnabledFor(logging.DEBUG) else None,
                 handle_parsing_errors=True
             )
             
-            logger.info("成功创建工具调用代理")
+            logger.info("成功创建工具调用代理 (最新信息: %s)", latest_info)
             return agent_executor
         except Exception as e:
-            logger.error(f"创建代理执行器失败: {e}")
+            logger.error("创建代理执行器失败: %s", e)
             return None
     
-    def _init_chain(self) -> Optional[ConversationalRetrievalChain]:
+    @property
+    def chain(self) -> Optional["ConversationalRetrievalChain"]:
+        """备用RAG链，首次访问时创建（代理可用时通常不会用到）"""
+        if self._chain is _UNSET:
+            self._chain = self._init_chain()
+        return self._chain
+    
+    def _init_chain(self) -> Optional["ConversationalRetrievalChain"]:
         """
         初始化传统RAG链 (作为备用)
         
@@ -290,16 +488,12 @@ class RAGChain:
             return None
         
         try:
-            # 创建检索器
-            retriever = self.vectorstore.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": 5}
-            )
+            from langchain.chains import ConversationalRetrievalChain
             
             # 创建RAG链
             chain = ConversationalRetrievalChain.from_llm(
                 llm=self.llm,
-                retriever=retriever,
+                retriever=self._retriever,
                 condense_question_prompt=self.condense_question_prompt,
                 combine_docs_chain_kwargs={"prompt": self.qa_prompt},
                 return_source_documents=True
@@ -309,7 +503,7 @@ class RAGChain:
             return chain
         
         except Exception as e:
-            logger.error(f"初始化备用RAG链失败: {e}")
+            logger.error("初始化备用RAG链失败: %s", e)
             return None
     
     def query(self, query: str) -> Dict[str, Any]:
@@ -323,7 +517,101 @@ class RAGChain:
             包含回答和相关文档的字典
         """
         with self._lock:
-            return self._internal_query(query)
+            # 语义相近的问题直接返回缓存的回答
+            embedding, cached = self._lookup_semantic_cache(query)
+            if cached is not None:
+                return self._use_cached_result(query, cached)
+            
+            result = self._internal_query(query)
+            if embedding is not None and result.get("success"):
+                self.semantic_cache.add(embedding, result)
+            return result
+    
+    def stream_query(self, query: str) -> Iterator[Dict[str, Any]]:
+        """
+        线程安全的流式查询处理，模型生成回答时逐段产出
+        
+        生成器运行期间持有实例锁，调用方应尽快消费完毕。
+        
+        Args:
+            query: 查询文本
+        
+        Yields:
+            {"delta": 回答片段}，最后产出一个带 "done": True 的完整结果（格式与query()相同）。
+            代理执行失败回退到传统RAG链时，以完整结果中的回答为准。
+        """
+        with self._lock:
+            embedding, cached = self._lookup_semantic_cache(query)
+            if cached is not None:
+                result = self._use_cached_result(query, cached)
+                yield {"delta": result["answer"]}
+                yield {**result, "done": True}
+                return
+            
+            logger.info("收到流式查询: %s", query)
+            result = None
+            if self.agent_executor:
+                try:
+                    from streaming import stream_invoke
+                    output = yield from stream_invoke(
+                        self._select_agent_executor(query),
+                        self._build_agent_inputs(query)
+                    )
+                    result = self._build_agent_result(query, output)
+                except Exception as e:
+                    logger.error("代理执行器流式处理查询失败: %s", e)
+                    logger.info("回退到传统RAG链处理查询")
+            
+            if result is None:
+                result = self._rag_query(query)
+                yield {"delta": result["answer"]}
+            
+            if embedding is not None and result.get("success"):
+                self.semantic_cache.add(embedding, result)
+            yield {**result, "done": True}
+    
+    def _use_cached_result(self, query: str, cached: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        使用语义缓存命中的结果回答查询
+        
+        Args:
+            query: 查询文本
+            cached: 缓存的查询结果
+        
+        Returns:
+            标记为语义缓存来源的结果副本
+        """
+        logger.info("语义缓存命中，跳过代理执行")
+        self._append_turn(query, cached["answer"])
+        return {
+            **cached,
+            "source_documents": list(cached["source_documents"]),
+            "search_type": "semantic_cache"
+        }
+    
+    def _lookup_semantic_cache(self, query: str) -> Tuple[Optional[List[float]], Optional[Dict[str, Any]]]:
+        """
+        计算查询向量并查找语义缓存
+        
+        Args:
+            query: 查询文本
+        
+        Returns:
+            (查询向量, 缓存结果)，缓存不可用、查询时间敏感或已有对话历史时向量为None
+        """
+        if self.semantic_cache is None or self.embeddings is None or _needs_latest_info(query):
+            return None, None
+        # 全局缓存只按问题向量匹配，有对话历史时回答依赖上下文，既不查找也不写入，
+        # 避免把一个会话的回答复用到另一个会话
+        with self._history_lock:
+            if self.chat_history:
+                return None, None
+        try:
+            embedding = self.embeddings.embed_query(query)
+        except Exception as e:
+            logger.warning("计算查询向量失败，跳过语义缓存: %s", e)
+            return None, None
+        return embedding, self.semantic_cache.lookup(embedding)
     
     def _internal_query(self, query: str) -> Dict[str, Any]:
         """
@@ -335,109 +623,17 @@ class RAGChain:
         Returns:
             包含回答和相关文档的字典
         """
-        logger.info(f"收到查询: {query}")
+        logger.info("收到查询: %s", query)
         
         # 使用代理执行器处理查询
         if self.agent_executor:
             try:
                 logger.info("使用工具调用代理处理查询，优先本地文档检索")
-                # 构建带有历史的输入，并强调必须先搜索本地文档
-                history_str = ""
-                if self.chat_history:
-                    for i in range(0, len(self.chat_history) - 1, 2):
-                        if i + 1 < len(self.chat_history):
-                            human_msg = self.chat_history[i]
-                            ai_msg = self.chat_history[i + 1]
-                            
-                            if isinstance(human_msg, HumanMessage) and isinstance(ai_msg, AIMessage):
-                                history_str += f"用户: {human_msg.content}\n助手: {ai_msg.content}\n\n"
-                
-                # 分析查询是否需要最新信息
-                needs_latest_info = any(keyword in query.lower() for keyword in [
-                    '最新', '2024', '2025', '当前', '现在', '趋势', '发展', '近期', '最近',
-                    '今年', '今天', '最新动态', '最新消息', '最新情况', '实时', '最新版本'
-                ])
-                
-                # 修改输入格式，强调完整的工作流程
-                if needs_latest_info:
-                    enhanced_input = f"""聊天历史:
-{history_str}
-
-用户问题: {query}
-
-重要提示：这个问题涉及最新信息或时间敏感内容。请按照以下流程处理：
-1. 首先使用document_search工具搜索本地文档
-2. 然后必须使用internet_search工具获取最新信息
-3. 结合两个来源的信息提供完整答案
-
-即使本地文档有相关信息，也要通过互联网搜索获取最新补充信息！"""
-                else:
-                    enhanced_input = f"""聊天历史:
-{history_str}
-
-用户问题: {query}
-
-请按照以下流程处理：
-1. 首先使用document_search工具搜索本地文档数据库
-2. 如果本地文档信息不完整或没有相关信息，请使用internet_search工具补充"""
-                
-                # 执行代理
-                result = self.agent_executor.invoke({"input": enhanced_input})
-                response = result.get("output", "")
-                
-                # 更新聊天历史
-                self.chat_history.append(HumanMessage(content=query))
-                self.chat_history.append(AIMessage(content=response))
-                
-                # 构建结果对象 (与传统RAG结果格式保持一致)
-                source_docs = []
-                search_type = "agent"
-                
-                # 分析工具使用情况
-                intermediate_steps = result.get("intermediate_steps", [])
-                used_document_search = False
-                used_internet_search = False
-                
-                for step in intermediate_steps:
-                    if len(step) >= 2:
-                        action, output = step[0], step[1]
-                        # 检查action对象的工具名称
-                        tool_name = getattr(action, 'tool', '') or getattr(action, 'name', '')
-                        
-                        if tool_name == "document_search":
-                            used_document_search = True
-                            if isinstance(output, list):
-                                source_docs.extend(output)
-                            elif isinstance(output, str) and "第" in output and "页" in output:
-                                # 如果输出是文档内容字符串，创建Document对象
-                                from langchain_core.documents import Document
-                                doc = Document(page_content=output, metadata={"source": "document_search"})
-                                source_docs.append(doc)
-                        elif tool_name == "internet_search":
-                            used_internet_search = True
-                
-                # 记录工具使用情况
-                if used_document_search and used_internet_search:
-                    search_type = "document+internet"
-                    logger.info("使用了本地文档检索和互联网搜索")
-                elif used_document_search:
-                    search_type = "document_only"
-                    logger.info("仅使用了本地文档检索")
-                elif used_internet_search:
-                    search_type = "internet_only"
-                    logger.warning("⚠️ 仅使用了互联网搜索，未优先检索本地文档")
-                
-                return {
-                    "answer": response,
-                    "source_documents": source_docs,
-                    "success": True,
-                    "search_type": search_type,
-                    "used_document_search": used_document_search,
-                    "used_internet_search": used_internet_search
-                }
+                result = self._select_agent_executor(query).invoke(self._build_agent_inputs(query))
+                return self._build_agent_result(query, result)
                 
             except Exception as e:
-                logger.error(f"代理执行器处理查询失败: {e}")
+                logger.error("代理执行器处理查询失败: %s", e)
                 # 回退到传统RAG链
                 logger.info("回退到传统RAG链处理查询")
                 return self._rag_query(query)
@@ -446,6 +642,101 @@ class RAGChain:
         logger.info("使用传统RAG链处理查询（代理执行器不可用）")
         return self._rag_query(query)
     
+    def _select_agent_executor(self, query: str) -> "AgentExecutor":
+        """
+        按问题是否需要最新信息选择代理执行器
+        
+        Args:
+            query: 查询文本
+        
+        Returns:
+            对应的代理执行器
+        """
+        if self._latest_agent_executor and _needs_latest_info(query):
+            return self._latest_agent_executor
+        return self.agent_executor
+    
+    def _build_agent_inputs(self, query: str) -> Dict[str, Any]:
+        """
+        构建代理输入：聊天历史作为消息传入，问题作为最后的用户消息
+        
+        Args:
+            query: 查询文本
+        
+        Returns:
+            代理执行器的输入字典
+        """
+        return {
+            "input": query,
+            "chat_history": self.get_chat_history()
+        }
+    
+    def _build_agent_result(self, query: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        记录代理的回答，并整理为与传统RAG结果一致的格式
+        
+        Args:
+            query: 查询文本
+            result: 代理执行器的输出
+        
+        Returns:
+            包含回答和相关文档的字典
+        """
+        response = result.get("output", "")
+        
+        # 更新聊天历史
+        self._append_turn(query, response)
+        
+        # 构建结果对象 (与传统RAG结果格式保持一致)
+        source_docs = []
+        search_type = "agent"
+        
+        # 分析工具使用情况
+        intermediate_steps = result.get("intermediate_steps", [])
+        used_document_search = False
+        used_internet_search = False
+        from langchain_core.documents import Document
+        
+        for step in intermediate_steps:
+            if len(step) >= 2:
+                action, output = step[0], step[1]
+                # 检查action对象的工具名称（AgentAction使用tool属性，其他对象回退到name）
+                tool_name = getattr(action, 'tool', None)
+                if tool_name is None:
+                    tool_name = getattr(action, 'name', '')
+                
+                if tool_name == "document_search":
+                    used_document_search = True
+                    if isinstance(output, list):
+                        source_docs.extend(output)
+                    elif isinstance(output, str) and _PAGE_RE.search(output):
+                        # 如果输出是文档内容字符串，创建Document对象
+                        source_docs.append(
+                            Document(page_content=output, metadata=_DOC_SEARCH_METADATA)
+                        )
+                elif tool_name == "internet_search":
+                    used_internet_search = True
+        
+        # 记录工具使用情况
+        if used_document_search and used_internet_search:
+            search_type = "document+internet"
+            logger.info("使用了本地文档检索和互联网搜索")
+        elif used_document_search:
+            search_type = "document_only"
+            logger.info("仅使用了本地文档检索")
+        elif used_internet_search:
+            search_type = "internet_only"
+            logger.warning("⚠️ 仅使用了互联网搜索，未优先检索本地文档")
+        
+        return {
+            "answer": response,
+            "source_documents": source_docs,
+            "success": True,
+            "search_type": search_type,
+            "used_document_search": used_document_search,
+            "used_internet_search": used_internet_search
+        }
+    
     def _rag_query(self, query: str) -> Dict[str, Any]:
         """
         使用传统RAG链执行查询 (备用方法)
@@ -473,8 +764,7 @@ class RAGChain:
             result = self.chain({"question": query, "chat_history": formatted_history})
             
             # 更新聊天历史
-            self.chat_history.append(HumanMessage(content=query))
-            self.chat_history.append(AIMessage(content=result["answer"]))
+            self._append_turn(query, result["answer"])
             
             # 返回结果
             return {
@@ -493,6 +783,44 @@ class RAGChain:
                 "success": False
             }
     
+    def _append_turn(self, query: str, answer: str) -> None:
+        """
+        记录一轮完整的问答
+        
+        Args:
+            query: 用户消息
+            answer: AI回复
+        """
+        from langchain_core.messages import AIMessage, HumanMessage
+        
+        with self._history_lock:
+            self.chat_history.append(HumanMessage(content=query))
+            self.chat_history.append(AIMessage(content=answer))
+            self._history_pairs.append((query, answer))
+            self._formatted_history.append({"role": "user", "content": query})
+            self._formatted_history.append({"role": "assistant", "content": answer})
+            self._pending_human = None
+    
+    def _record(self, message: "BaseMessage") -> None:
+        """
+        记录单条消息，并增量维护 (用户消息, AI回复) 配对
+        
+        Args:
+            message: 要记录的消息
+        """
+        from langchain_core.messages import AIMessage, HumanMessage
+        
+        self.chat_history.append(message)
+        self._formatted_history.append(_format_message(message))
+        if isinstance(message, HumanMessage):
+            self._pending_human = message.content
+        elif isinstance(message, AIMessage) and self._pending_human is not None:
+            self._history_pairs.append((self._pending_human, message.content))
+            self._pending_human = None
+        else:
+            # 其他消息打断了问答配对
+            self._pending_human = None
+    
     def _format_chat_history(self) -> List[Tuple[str, str]]:
         """
         格式化聊天历史
@@ -500,20 +828,10 @@ class RAGChain:
         Returns:
             元组列表，每个元组包含一个用户消息和对应的AI回复
         """
-        formatted_history = []
-        
-        # 必须成对出现，一个人类消息对应一个AI消息
-        for i in range(0, len(self.chat_history) - 1, 2):
-            if i + 1 < len(self.chat_history):
-                human_msg = self.chat_history[i]
-                ai_msg = self.chat_history[i + 1]
-                
-                if isinstance(human_msg, HumanMessage) and isinstance(ai_msg, AIMessage):
-                    formatted_history.append((human_msg.content, ai_msg.content))
-        
-        return formatted_history
+        with self._history_lock:
+            return list(self._history_pairs)
     
-    def add_message(self, message: Union[str, BaseMessage], role: str = "human") -> None:
+    def add_message(self, message: Union[str, "BaseMessage"], role: str = "human") -> None:
         """
         添加消息到聊天历史
         
@@ -521,27 +839,33 @@ class RAGChain:
             message: 消息内容
             role: 消息角色 ('human' 或 'ai')
         """
-        with self._lock:
+        from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+        
+        with self._history_lock:
             if isinstance(message, BaseMessage):
-                self.chat_history.append(message)
+                self._record(message)
             else:
                 if role.lower() == "human":
-                    self.chat_history.append(HumanMessage(content=message))
+                    self._record(HumanMessage(content=message))
                 elif role.lower() == "ai":
-                    self.chat_history.append(AIMessage(content=message))
+                    self._record(AIMessage(content=message))
                 else:
-                    logger.warning(f"未知角色: {role}，使用'human'")
-                    self.chat_history.append(HumanMessage(content=message))
+                    logger.warning("未知角色: %s，使用'human'", role)
+                    self._record(HumanMessage(content=message))
     
     def clear_history(self) -> None:
         """清空聊天历史"""
-        with self._lock:
-            self.chat_history = []
+        with self._history_lock:
+            self.chat_history.clear()
+            self._history_pairs.clear()
+            self._formatted_history.clear()
+            self._pending_human = None
             logger.info("已清空聊天历史")
     
-    def get_chat_history(self) -> List[BaseMessage]:
+    def get_chat_history(self) -> List["BaseMessage"]:
         """获取聊天历史"""
-        return self.chat_history
+        with self._history_lock:
+            return list(self.chat_history)
     
     def get_formatted_history(self) -> List[Dict[str, str]]:
         """
@@ -550,31 +874,8 @@ class RAGChain:
         Returns:
             字典列表，每个字典包含角色和内容
         """
-        formatted = []
-        
-        for message in self.chat_history:
-            if isinstance(message, HumanMessage):
-                formatted.append({
-                    "role": "user",
-                    "content": message.content
-                })
-            elif isinstance(message, AIMessage):
-                formatted.append({
-                    "role": "assistant",
-                    "content": message.content
-                })
-            elif isinstance(message, SystemMessage):
-                formatted.append({
-                    "role": "system",
-                    "content": message.content
-                })
-            else:
-                formatted.append({
-                    "role": "unknown",
-                    "content": str(message)
-                })
-        
-        return formatted
+        with self._history_lock:
+            return list(self._formatted_history)
 
 # 移除全局单例，改为工厂方法
 def create_rag_chain() -> RAGChain:
@@ -4,12 +4,24 @@
 """
 import threading
 import logging
-from typing import Optional, List, Dict, Any
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
 import os
 from langchain_core.documents import Document
 
 logger = logging.getLogger(__name__)
 
+# 搜索结果缓存的容量和有效期（秒）
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 300
+
+# 统计信息的缓存有效期（秒），频繁轮询时直接返回上一次的结果
+STATS_CACHE_TTL = 1.0
+
+# 健康检查结果的缓存有效期（秒）
+HEALTH_CHECK_TTL = 5.0
+
 class ResourceManager:
     """资源管理器 - 单例模式，管理共享资源"""
     _instance = None
@@ -38,8 +50,11 @@ class ResourceManager:
             # 创建向量数据库访问锁
             self.vectorstore_lock = threading.Lock()
             
-            # 创建文档搜索锁
-            self.search_lock = threading.Lock()
+            # 搜索结果缓存（LRU），键为 (查询, k, 是否带分数)，值为 (写入时间, 索引版本, 结果)。
+            # 无论文档经由哪个入口（本类、文件监听器或文档处理器）写入，索引版本都会变化，旧结果随之失效
+            # FAISS索引支持并发只读搜索，搜索本身不再加全局锁，仅缓存读写需要加锁
+            self._search_cache = OrderedDict()
+            self._search_cache_lock = threading.Lock()
             
             # 缓存向量数据库实例
             self._vectorstore_cache = None
@@ -48,8 +63,20 @@ class ResourceManager:
             # 资源统计
             self._access_count = 0
             self._error_count = 0
+            # 错误率随计数增量更新，读取统计时无需再计算
+            self._error_rate = 0.0
             self._stats_lock = threading.Lock()
             
+            # 已处理文档名的元组缓存，文档变化时置为None
+            self._doc_keys_tuple = None
+            # 最近一次的统计结果及其生成时间
+            self._stats_cache = None
+            self._stats_cache_at = 0.0
+            
+            # 最近一次的健康检查结果及其生成时间
+            self._last_hc = None
+            self._last_hc_t = 0.0
+            
             logger.info("资源管理器初始化完成")
             
         except Exception as e:
@@ -71,45 +98,104 @@ class ResourceManager:
             self._increment_access_count()
             return self._vectorstore_cache
     
+    def _current_vectorstore(self):
+        """
+        搜索热路径使用的向量数据库获取方法
+        
+        已缓存时直接读取属性（单次属性读取在CPython中是原子的），不获取锁；
+        缓存被清除后才走get_vectorstore的加锁路径。
+        """
+        vectorstore = self._vectorstore_cache
+        if vectorstore is None:
+            vectorstore = self.get_vectorstore()
+        return vectorstore
+    
+    def _get_cached_search(self, key: Tuple, index_version: int) -> Optional[list]:
+        """查找未过期且与当前索引版本一致的搜索结果缓存"""
+        with self._search_cache_lock:
+            entry = self._search_cache.get(key)
+            if entry is None:
+                return None
+            written_at, version, results = entry
+            if version != index_version or time.monotonic() - written_at > SEARCH_CACHE_TTL:
+                del self._search_cache[key]
+                return None
+            self._search_cache.move_to_end(key)
+            return list(results)
+    
+    def _store_search(self, key: Tuple, index_version: int, results: list) -> None:
+        """
+        写入搜索结果缓存，超出容量时淘汰最久未使用的条目
+        
+        Args:
+            key: 缓存键
+            index_version: 搜索开始前读取的索引版本（搜索期间写入了新文档时，该结果随即失效）
+            results: 搜索结果
+        """
+        with self._search_cache_lock:
+            self._search_cache[key] = (time.monotonic(), index_version, list(results))
+            self._search_cache.move_to_end(key)
+            while len(self._search_cache) > SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+    
+    def _clear_search_cache(self) -> None:
+        """清空搜索结果缓存（向量数据库内容变化时调用）"""
+        with self._search_cache_lock:
+            self._search_cache.clear()
+    
     def search_documents(self, query: str, k: int = 5) -> List[Document]:
         """线程安全地搜索文档"""
-        with self.search_lock:
-            try:
-                self._increment_access_count()
-                vectorstore = self.get_vectorstore()
-                if vectorstore is None:
-                    logger.warning("向量数据库不可用，返回空结果")
-                    return []
-                
-                # 执行搜索
-                results = vectorstore.similarity_search(query, k=k)
-                logger.info(f"文档搜索完成: 查询='{query}', 结果数={len(results)}")
+        try:
+            self._increment_access_count()
+            key = (query, k, False)
+            index_version = self.document_processor.index_version
+            results = self._get_cached_search(key, index_version)
+            if results is not None:
+                logger.debug("文档搜索命中缓存: 查询='%s'", query)
                 return results
-                
-            except Exception as e:
-                logger.error(f"文档搜索失败: {e}")
-                self._increment_error_count()
+            
+            vectorstore = self._current_vectorstore()
+            if vectorstore is None:
+                logger.warning("向量数据库不可用，返回空结果")
                 return []
+            
+            # 执行搜索
+            results = vectorstore.similarity_search(query, k=k)
+            self._store_search(key, index_version, results)
+            logger.info(f"文档搜索完成: 查询='{query}', 结果数={len(results)}")
+            return results
+            
+        except Exception as e:
+            logger.error(f"文档搜索失败: {e}")
+            self._increment_error_count()
+            return []
     
     def search_documents_with_score(self, query: str, k: int = 5) -> List[tuple]:
         """线程安全地搜索文档（带相似度分数）"""
-        with self.search_lock:
-            try:
-                self._increment_access_count()
-                vectorstore = self.get_vectorstore()
-                if vectorstore is None:
-                    logger.warning("向量数据库不可用，返回空结果")
-                    return []
-                
-                # 执行带分数的搜索
-                results = vectorstore.similarity_search_with_score(query, k=k)
-                logger.info(f"文档搜索（带分数）完成: 查询='{query}', 结果数={len(results)}")
+        try:
+            self._increment_access_count()
+            key = (query, k, True)
+            index_version = self.document_processor.index_version
+            results = self._get_cached_search(key, index_version)
+            if results is not None:
+                logger.debug("文档搜索（带分数）命中缓存: 查询='%s'", query)
                 return results
-                
-            except Exception as e:
-                logger.error(f"文档搜索（带分数）失败: {e}")
-                self._increment_error_count()
+            
+            vectorstore = self._current_vectorstore()
+            if vectorstore is None:
+                logger.warning("向量数据库不可用，返回空结果")
                 return []
+            
+            # 执行带分数的搜索
+            results = vectorstore.similarity_search_with_score(query, k=k)
+            self._store_search(key, index_version, results)
+            logger.info(f"文档搜索（带分数）完成: 查询='{query}', 结果数={len(results)}")
+            return results
+            
+        except Exception as e:
+            logger.error(f"文档搜索（带分数）失败: {e}")
+            self._increment_error_count()
+            return []
     
     def process_document(self, file_path: str) -> bool:
         """线程安全地处理文档"""
@@ -129,6 +215,8 @@ class ResourceManager:
                 with self._vectorstore_cache_lock:
                     self._vectorstore_cache = None
                     logger.info("向量数据库缓存已清除，将在下次访问时重新加载")
+                self._clear_search_cache()
+                self._doc_keys_tuple = None
             
             return success
             
@@ -151,6 +239,7 @@ class ResourceManager:
             with self._vectorstore_cache_lock:
                 self._vectorstore_cache = None
                 logger.info("向量数据库缓存已手动清除")
+            self._clear_search_cache()
             
             # 立即重新加载
             self.get_vectorstore()
@@ -165,19 +254,42 @@ class ResourceManager:
         """增加访问计数"""
         with self._stats_lock:
             self._access_count += 1
+            self._error_rate = self._error_count * 100.0 / self._access_count
     
     def _increment_error_count(self):
         """增加错误计数"""
         with self._stats_lock:
             self._error_count += 1
+            self._error_rate = self._error_count * 100.0 / max(self._access_count, 1)
+    
+    def _get_doc_keys(self, doc_metadata: Dict[str, Any]) -> Tuple[str, ...]:
+        """
+        获取已处理文档名的元组，文档数量不变时复用上一次的结果
+        
+        文件监控会绕过资源管理器直接处理文档，因此除了process_document中的失效外，
+        文档数量变化时也重新生成。
+        """
+        keys = self._doc_keys_tuple
+        if keys is None or len(keys) != len(doc_metadata):
+            keys = self._doc_keys_tuple = tuple(doc_metadata)
+        return keys
     
     def get_stats(self) -> Dict[str, Any]:
-        """获取资源使用统计"""
+        """
+        获取资源使用统计
+        
+        结果缓存STATS_CACHE_TTL秒，调用方不应修改返回的字典。
+        """
+        now = time.monotonic()
+        stats = self._stats_cache
+        if stats is not None and now - self._stats_cache_at < STATS_CACHE_TTL:
+            return stats
+        
         with self._stats_lock:
             stats = {
                 "access_count": self._access_count,
                 "error_count": self._error_count,
-                "error_rate": self._error_count / max(self._access_count, 1) * 100,
+                "error_rate": self._error_rate,
                 "vectorstore_cached": self._vectorstore_cache is not None
             }
         
@@ -186,15 +298,26 @@ class ResourceManager:
             doc_metadata = self.get_document_metadata()
             stats.update({
                 "processed_documents": len(doc_metadata),
-                "document_files": list(doc_metadata.keys()) if doc_metadata else []
+                "document_files": self._get_doc_keys(doc_metadata) if doc_metadata else ()
             })
         except Exception as e:
             logger.warning(f"获取文档统计失败: {e}")
         
+        self._stats_cache = stats
+        self._stats_cache_at = now
         return stats
     
     def health_check(self) -> Dict[str, Any]:
-        """系统健康检查"""
+        """
+        系统健康检查（轻量探测，不执行嵌入和检索）
+        
+        只检查文档处理器和向量数据库是否可用，结果缓存HEALTH_CHECK_TTL秒。
+        需要验证完整搜索链路时使用deep_health_check。
+        """
+        now = time.monotonic()
+        if self._last_hc is not None and now - self._last_hc_t < HEALTH_CHECK_TTL:
+            return self._last_hc
+        
         health_status = {
             "status": "healthy",
             "checks": {},
@@ -212,10 +335,13 @@ class ResourceManager:
             health_status["checks"]["document_processor"] = f"error: {e}"
             health_status["status"] = "unhealthy"
         
-        # 检查向量数据库
+        # 检查向量数据库（读取索引中的向量数量，O(1)）
         try:
             vectorstore = self.get_vectorstore()
             if vectorstore:
+                index = getattr(vectorstore, "index", None)
+                if index is not None:
+                    health_status["checks"]["vectorstore_size"] = index.ntotal
                 health_status["checks"]["vectorstore"] = "ok"
             else:
                 health_status["checks"]["vectorstore"] = "error"
@@ -224,10 +350,25 @@ class ResourceManager:
             health_status["checks"]["vectorstore"] = f"error: {e}"
             health_status["status"] = "unhealthy"
         
-        # 检查搜索功能
+        self._last_hc = health_status
+        self._last_hc_t = now
+        return health_status
+    
+    def deep_health_check(self) -> Dict[str, Any]:
+        """
+        完整健康检查，在轻量探测的基础上实际执行一次搜索
+        
+        会触发一次嵌入调用，不适合频繁轮询。
+        """
+        health_status = dict(self.health_check())
+        health_status["checks"] = dict(health_status["checks"])
+        
+        # 检查搜索功能（直接访问向量数据库，绕过搜索结果缓存）
         try:
-            # 执行一个简单的搜索测试
-            test_results = self.search_documents("test", k=1)
+            vectorstore = self.get_vectorstore()
+            if vectorstore is None:
+                raise RuntimeError("向量数据库不可用")
+            vectorstore.similarity_search("test", k=1)
             health_status["checks"]["search"] = "ok"
         except Exception as e:
             health_status["checks"]["search"] = f"error: {e}"
@@ -242,6 +383,7 @@ class ResourceManager:
             
             with self._vectorstore_cache_lock:
                 self._vectorstore_cache = None
+            self._clear_search_cache()
             
             logger.info("资源管理器清理完成")
             
@@ -4,12 +4,19 @@
 """
 
 import os
+import time
 import logging
-from typing import List, Dict, Any, Optional
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Callable, Hashable
 import json
 
-# 日志配置
-logging.basicConfig(level=logging.INFO)
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 logger = logging.getLogger(__name__)
 
 # 导入环境变量管理器
@@ -20,6 +27,194 @@ except ImportError:
     env_manager = None
     logger.warning("环境变量管理器不可用，将使用默认环境变量")
 
+# 搜索API地址（直接调用REST接口，不再经过厂商SDK）
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+SERPAPI_SEARCH_URL = "https://serpapi.com/search.json"
+
+# 搜索请求超时（秒）
+SEARCH_TIMEOUT = 10
+
+def _create_http_client():
+    """
+    创建所有搜索请求共用的HTTP客户端，复用到搜索服务的连接，避免每次重新握手
+    
+    安装了httpx和h2时使用HTTP/2客户端，并发搜索在同一个连接上多路复用；
+    否则使用带连接池的requests会话。两者的get/post接口一致。
+    
+    Returns:
+        HTTP客户端
+    """
+    try:
+        import h2  # noqa: F401  HTTP/2支持需要h2
+        import httpx
+        client = httpx.Client(
+            timeout=httpx.Timeout(SEARCH_TIMEOUT, connect=3.0),
+            transport=httpx.HTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+                retries=2
+            )
+        )
+        logger.info("搜索请求使用HTTP/2客户端")
+        return client
+    except ImportError:
+        pass
+    
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(("GET", "POST"))
+        )
+    ))
+    return session
+
+_session = _create_http_client()
+
+# 搜索结果缓存的容量和有效期（秒）
+SEARCH_CACHE_SIZE = 512
+SEARCH_CACHE_TTL = 300
+# 搜索失败后的短期缓存（秒），期间相同查询直接返回空结果，避免服务故障或限流时反复重试
+NEGATIVE_CACHE_TTL = 30
+
+# 同时向多个搜索服务发起请求的线程池
+_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="search")
+
+class TTLCache:
+    """带有效期的LRU缓存，超出容量时淘汰最久未使用的条目"""
+    
+    def __init__(self, maxsize: int = 512, ttl: float = 300):
+        """
+        初始化缓存
+        
+        Args:
+            maxsize: 最大条目数
+            ttl: 条目有效期（秒）
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # 键 -> (过期时间, 值)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        获取未过期的缓存值
+        
+        Args:
+            key: 缓存键
+        
+        Returns:
+            缓存值，不存在或已过期时返回None
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        写入缓存
+        
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 该条目的有效期（秒），默认使用缓存的有效期
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """获取缓存命中统计"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+def ttl_cache(maxsize: int = 512, ttl: float = 300, negative_ttl: float = 0) -> Callable:
+    """
+    为搜索方法添加结果缓存的装饰器
+    
+    缓存键为 (工具类名, 规范化后的查询, 最大结果数)，空结果不缓存。
+    被装饰的方法抛出异常时返回空列表，并将失败缓存negative_ttl秒。
+    同一个键的请求正在执行时，后到的调用等待并共享该请求的结果，不重复发起请求。
+    
+    Args:
+        maxsize: 最大缓存条目数
+        ttl: 缓存有效期（秒）
+        negative_ttl: 失败结果的缓存有效期（秒），0表示不缓存失败
+    
+    Returns:
+        装饰器
+    """
+    def decorator(func: Callable) -> Callable:
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # 正在执行的请求：键 -> Future
+        inflight: Dict[Hashable, Future] = {}
+        inflight_lock = threading.Lock()
+        
+        @functools.wraps(func)
+        def wrapper(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+            key = (self.__class__.__name__, query.strip().lower(), max_results)
+            results = cache.get(key)
+            if results is not None:
+                if not results:
+                    logger.debug("搜索近期失败，返回缓存的空结果: %s", query)
+                    return []
+                logger.info("搜索命中缓存: %s", query)
+                return list(results)
+            
+            with inflight_lock:
+                future = inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = inflight[key] = Future()
+            
+            if not leader:
+                logger.info("等待相同的搜索请求完成: %s", query)
+                return list(future.result())
+            
+            try:
+                try:
+                    results = func(self, query, max_results)
+                except Exception:
+                    results = []
+                    if negative_ttl > 0:
+                        cache.set(key, [], ttl=negative_ttl)
+                else:
+                    if results:
+                        cache.set(key, list(results))
+                future.set_result(results)
+                return results
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with inflight_lock:
+                    inflight.pop(key, None)
+        
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
 class TavilySearchTool:
     """基于Tavily的搜索工具"""
     
@@ -32,20 +227,13 @@ class TavilySearchTool:
         
         if not self.api_key:
             logger.warning("未配置Tavily API Key，搜索功能将不可用")
-            self.client = None
         else:
-            try:
-                # 尝试导入Tavily客户端
-                from tavily import TavilyClient
-                self.client = TavilyClient(api_key=self.api_key)
-                logger.info("Tavily搜索工具初始化成功")
-            except ImportError:
-                logger.error("无法导入tavily模块，请确保已安装: pip install tavily-python")
-                self.client = None
-            except Exception as e:
-                logger.error(f"初始化Tavily客户端时出错: {e}")
-                self.client = None
+            logger.info("Tavily搜索工具初始化成功")
+        
+        # 每次请求都相同的认证头
+        self._headers = {"Authorization": f"Bearer {self.api_key}"}
     
+    @ttl_cache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL)
     def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """
         使用Tavily进行搜索
@@ -57,35 +245,46 @@ class TavilySearchTool:
         Returns:
             搜索结果列表
         """
-        if not self.client:
+        if not self.api_key:
             logger.error("Tavily客户端未初始化，无法进行搜索")
             return []
         
         try:
-            logger.info(f"执行Tavily搜索: {query}")
+            logger.info("执行Tavily搜索: %s", query)
             # 执行搜索
-            search_response = self.client.search(
-                query=query,
-                max_results=max_results,
-                include_answer=True,
-                include_raw_content=False
+            response = _session.post(
+                TAVILY_SEARCH_URL,
+                json={
+                    "query": query,
+                    "max_results": max_results,
+                    "include_answer": True,
+                    "include_raw_content": False
+                },
+                headers=self._headers,
+                timeout=SEARCH_TIMEOUT
             )
+            response.raise_for_status()
+            search_response = response.json()
             
             # 处理结果
             results = []
             if "results" in search_response:
                 results = search_response["results"]
-                logger.info(f"Tavily搜索返回 {len(results)} 个结果")
+                logger.info("Tavily搜索返回 %s 个结果", len(results))
             
             return results
         
         except Exception as e:
-            logger.error(f"Tavily搜索出错: {e}")
-            return []
+            logger.error("Tavily搜索出错: %s", e)
+            raise
     
     def is_available(self) -> bool:
         """检查Tavily搜索工具是否可用"""
-        return self.client is not None
+        return bool(self.api_key)
+    
+    def clear_cache(self) -> None:
+        """清空搜索结果缓存（包括失败缓存）"""
+        TavilySearchTool.search.cache.clear()
 
 class SerpAPISearchTool:
     """基于SerpAPI的搜索工具"""
@@ -99,20 +298,13 @@ class SerpAPISearchTool:
         
         if not self.api_key:
             logger.warning("未配置SerpAPI API Key，搜索功能将不可用")
-            self.client = None
         else:
-            try:
-                # 尝试导入SerpAPI客户端
-                from serpapi import GoogleSearch
-                self.client = GoogleSearch
-                logger.info("SerpAPI搜索工具初始化成功")
-            except ImportError:
-                logger.error("无法导入serpapi模块，请确保已安装: pip install google-search-results")
-                self.client = None
-            except Exception as e:
-                logger.error(f"初始化SerpAPI客户端时出错: {e}")
-                self.client = None
+            logger.info("SerpAPI搜索工具初始化成功")
+        
+        # 每次请求都相同的查询参数
+        self._base_params = {"engine": "google", "api_key": self.api_key}
     
+    @ttl_cache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL)
     def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """
         使用SerpAPI进行搜索
@@ -124,43 +316,43 @@ class SerpAPISearchTool:
         Returns:
             搜索结果列表
         """
-        if not self.client:
+        if not self.api_key:
             logger.error("SerpAPI客户端未初始化，无法进行搜索")
             return []
         
         try:
-            logger.info(f"执行SerpAPI搜索: {query}")
+            logger.info("执行SerpAPI搜索: %s", query)
             # 执行搜索
-            params = {
-                "engine": "google",
-                "q": query,
-                "api_key": self.api_key,
-                "num": max_results
-            }
+            params = {**self._base_params, "q": query, "num": max_results}
             
-            search = self.client(params)
-            search_response = search.get_dict()
+            response = _session.get(SERPAPI_SEARCH_URL, params=params, timeout=SEARCH_TIMEOUT)
+            response.raise_for_status()
+            search_response = response.json()
             
-            # 处理结果
-            results = []
-            if "organic_results" in search_response:
-                for result in search_response["organic_results"][:max_results]:
-                    results.append({
-                        "title": result.get("title", ""),
-                        "url": result.get("link", ""),
-                        "content": result.get("snippet", "")
-                    })
-                logger.info(f"SerpAPI搜索返回 {len(results)} 个结果")
+            # 处理结果，转换为与Tavily一致的字段
+            results = [
+                {
+                    "title": result.get("title", ""),
+                    "url": result.get("link", ""),
+                    "content": result.get("snippet", "")
+                }
+                for result in search_response.get("organic_results", ())[:max_results]
+            ]
+            logger.info("SerpAPI搜索返回 %s 个结果", len(results))
             
             return results
         
         except Exception as e:
-            logger.error(f"SerpAPI搜索出错: {e}")
-            return []
+            logger.error("SerpAPI搜索出错: %s", e)
+            raise
     
     def is_available(self) -> bool:
         """检查SerpAPI搜索工具是否可用"""
-        return self.client is not None
+        return bool(self.api_key)
+    
+    def clear_cache(self) -> None:
+        """清空搜索结果缓存（包括失败缓存）"""
+        SerpAPISearchTool.search.cache.clear()
 
 class SearchToolFactory:
     """搜索工具工厂，用于创建合适的搜索工具"""
@@ -178,7 +370,7 @@ class SearchToolFactory:
         if env_manager:
             search_tool_type = env_manager.search_tool.lower()
         
-        logger.info(f"使用搜索工具: {search_tool_type}")
+        logger.info("使用搜索工具: %s", search_tool_type)
         
         # 创建对应的搜索工具
         if search_tool_type == "tavily":
@@ -205,9 +397,28 @@ class SearchToolFactory:
         
         logger.error("所有搜索工具都不可用")
         return None
+    
+    @staticmethod
+    def create_available_tools() -> List[Any]:
+        """
+        创建所有可用的搜索工具
+        
+        Returns:
+            可用的搜索工具列表，配置的首选工具排在最前
+        """
+        search_tool_type = os.getenv("SEARCH_TOOL", "tavily").lower()
+        if env_manager:
+            search_tool_type = env_manager.search_tool.lower()
+        
+        if search_tool_type == "serpapi":
+            tools = [SerpAPISearchTool(), TavilySearchTool()]
+        else:
+            tools = [TavilySearchTool(), SerpAPISearchTool()]
+        return [tool for tool in tools if tool.is_available()]
 
-# 单例模式
+# 单例模式（多线程服务器中可能被并发调用，初始化时加锁）
 _search_tool_instance = None
+_search_tool_lock = threading.Lock()
 
 def get_search_tool():
     """
@@ -218,11 +429,73 @@ def get_search_tool():
     """
     global _search_tool_instance
     if _search_tool_instance is None:
-        _search_tool_instance = SearchToolFactory.create_search_tool()
+        with _search_tool_lock:
+            if _search_tool_instance is None:
+                _search_tool_instance = SearchToolFactory.create_search_tool()
     return _search_tool_instance
 
+_search_tools_instance = None
+
+def get_search_tools() -> List[Any]:
+    """
+    获取所有可用的搜索工具实例
+    
+    Returns:
+        搜索工具列表
+    """
+    global _search_tools_instance
+    if _search_tools_instance is None:
+        with _search_tool_lock:
+            if _search_tools_instance is None:
+                _search_tools_instance = SearchToolFactory.create_available_tools()
+    return _search_tools_instance
+
+def reset_search_tools() -> None:
+    """丢弃已创建的搜索工具实例，下次获取时重新读取配置创建"""
+    global _search_tool_instance, _search_tools_instance
+    with _search_tool_lock:
+        _search_tool_instance = None
+        _search_tools_instance = None
+
+def search_with_fallback(query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+    """
+    同时向所有可用的搜索服务发起搜索，返回最先得到的非空结果
+    
+    最坏情况下的耗时为各服务中最慢的一个，而不是依次尝试的总和。
+    
+    Args:
+        query: 搜索查询
+        max_results: 最大结果数
+    
+    Returns:
+        搜索结果列表，所有服务都没有结果时返回空列表
+    """
+    tools = get_search_tools()
+    if not tools:
+        logger.error("所有搜索工具都不可用")
+        return []
+    if len(tools) == 1:
+        return tools[0].search(query, max_results)
+    
+    futures = [_search_executor.submit(tool.search, query, max_results) for tool in tools]
+    try:
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.error("搜索出错: %s", e)
+                continue
+            if results:
+                return results
+        return []
+    finally:
+        # 尚未开始的请求直接取消，已在执行的请求结果被丢弃
+        for future in futures:
+            future.cancel()
+
 # 测试代码
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     search_tool = get_search_tool()
     if search_tool:
         results = search_tool.search("人工智能的最新发展")
@@ -0,0 +1,136 @@
+"""
+语义缓存模块
+缓存已回答问题的向量和结果，语义相近的问题直接复用已有回答
+"""
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import DefaultConfig
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """
+    语义缓存，基于余弦相似度查找最相近的历史问题
+
+    向量归一化后存放在预分配的环形缓冲矩阵中，
+    查找时一次矩阵乘法即可得到与所有缓存问题的相似度。
+    """
+
+    def __init__(self, capacity: int = DefaultConfig.DEFAULT_SEMANTIC_CACHE_SIZE,
+                 threshold: float = DefaultConfig.DEFAULT_SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = DefaultConfig.DEFAULT_SEMANTIC_CACHE_TTL):
+        """
+        初始化语义缓存
+
+        Args:
+            capacity: 最多缓存的问题数，写满后覆盖最早的条目
+            threshold: 命中所需的最小余弦相似度
+            ttl: 缓存条目的有效期（秒），0表示不过期
+        """
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+
+        # 向量维度在第一次写入时确定，届时再分配矩阵
+        self._matrix: Optional[np.ndarray] = None
+        self._results: List[Optional[Dict[str, Any]]] = [None] * capacity
+        # 各条目的写入时间（time.monotonic）
+        self._written_at = np.zeros(capacity, dtype=np.float64)
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> Optional[np.ndarray]:
+        """将向量转为float32并做L2归一化，零向量返回None"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+    def lookup(self, embedding: Sequence[float]) -> Optional[Dict[str, Any]]:
+        """
+        查找与给定向量最相近的缓存结果
+
+        Args:
+            embedding: 问题的向量
+
+        Returns:
+            相似度达到阈值时返回缓存的结果，否则返回None
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return None
+
+        with self._lock:
+            if self._size == 0 or self._matrix.shape[1] != vector.shape[0]:
+                return None
+            similarities = self._matrix[:self._size] @ vector
+            if self.ttl > 0:
+                # 过期条目不参与匹配
+                expired = self._written_at[:self._size] < time.monotonic() - self.ttl
+                similarities[expired] = -1.0
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            logger.debug("语义缓存命中，相似度: %.3f", similarities[best])
+            return self._results[best]
+
+    def add(self, embedding: Sequence[float], result: Dict[str, Any]) -> None:
+        """
+        写入一条缓存，缓存已满时覆盖最早的条目
+
+        Args:
+            embedding: 问题的向量
+            result: 问题对应的查询结果
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+
+        with self._lock:
+            # 首次写入或向量维度变化（更换了嵌入模型）时重新分配
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.empty((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._results = [None] * self.capacity
+                self._size = 0
+                self._next = 0
+
+            self._matrix[self._next] = vector
+            self._results[self._next] = result
+            self._written_at[self._next] = time.monotonic()
+            self._next = (self._next + 1) % self.capacity
+            if self._size < self.capacity:
+                self._size += 1
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._results = [None] * self.capacity
+            self._size = 0
+            self._next = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+# 全局语义缓存实例（容量为0时禁用）
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', str(DefaultConfig.DEFAULT_SEMANTIC_CACHE_SIZE)))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', str(DefaultConfig.DEFAULT_SEMANTIC_CACHE_THRESHOLD)))
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', str(DefaultConfig.DEFAULT_SEMANTIC_CACHE_TTL)))
+
+semantic_cache = SemanticCache(
+    capacity=SEMANTIC_CACHE_SIZE,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    ttl=SEMANTIC_CACHE_TTL
+) if SEMANTIC_CACHE_SIZE > 0 else None
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """获取全局语义缓存实例，未启用时返回None"""
+    return semantic_cache
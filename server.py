@@ -1,6 +1,8 @@
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 import os
+import re
 import json
+import hashlib
 import logging
 import socketserver
 import threading
@@ -18,86 +20,89 @@ try:
     import chatbot
     logger.info("已导入chatbot模块")
 except ImportError as e:
-    logger.error(f"无法导入chatbot模块: {e}")
+    logger.error("无法导入chatbot模块: %s", e)
     chatbot = None
 
+# 优先使用orjson编解码JSON（直接处理UTF-8字节），未安装时回退到标准库json
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+# API密钥掩码工具
+try:
+    from env_manager import mask_api_key
+except ImportError:
+    def mask_api_key(api_key, visible=5):
+        """环境变量管理器不可用时，日志中不输出密钥的任何部分"""
+        return "***"
+
 # 添加会话管理器
 try:
     from session_manager import get_session_manager
     session_manager = get_session_manager()
     logger.info("已导入会话管理器")
 except ImportError as e:
-    logger.error(f"无法导入会话管理器: {e}")
+    logger.error("无法导入会话管理器: %s", e)
     session_manager = None
 
-class ThreadedHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
-    """处理请求的线程化版本的HTTP服务器"""
-    daemon_threads = True
+# 服务所用的文件路径（不随请求变化，启动时计算一次）
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+_IMAGES_DIR = os.path.join(_BASE_DIR, 'images')
+_INDEX_PATH = os.path.join(_BASE_DIR, 'index.html')
+_CHATBOT_PATH = os.path.join(_BASE_DIR, 'chatbot.py')
 
-class GalleryHandler(SimpleHTTPRequestHandler):
-    def do_GET(self):
-        # 规范化路径以处理各种URL编码问题
-        parsed_path = urllib.parse.urlparse(self.path)
-        path = parsed_path.path
-        
-        logger.info(f"处理GET请求: {path}")
-        
-        # 处理根目录请求
-        if path == '/':
-            try:
-                # 获取index.html的路径
-                index_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html')
-                if not os.path.exists(index_path):
-                    logger.error(f"index.html not found: {index_path}")
-                    self.send_error(404, "index.html not found")
-                    return
-                
-                # 读取并发送index.html
-                with open(index_path, 'rb') as f:
-                    content = f.read()
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html; charset=utf-8')
-                self.send_header('Content-Length', str(len(content)))
-                self.end_headers()
-                self.wfile.write(content)
-                logger.info("成功返回index.html")
-                return
-                
-            except Exception as e:
-                logger.error(f"处理根目录请求时出错: {str(e)}")
-                self.send_error(500, str(e))
-                return
-        
-        # 处理chatbot请求 - 直接内嵌聊天界面
-        elif path == '/chatbot':
-            try:
-                logger.info("提供简易聊天界面")
-                
-                # 检查API密钥
-                api_key = os.environ.get("OPENAI_API_KEY", "")
-                api_key_preview = api_key[:5] + "****" if len(api_key) > 5 else "未设置" 
-                logger.info(f"当前API Key: {api_key_preview}")
-                
-                # 返回一个简单的HTML页面
-                html_content = f"""<!DOCTYPE html>
+# 画廊目录中按扩展名（小写，不含点）区分的文件类型
+IMAGE_EXTENSIONS = frozenset(('jpg', 'jpeg', 'png', 'gif'))
+DOCUMENT_EXTENSIONS = frozenset(('pdf', 'docx', 'doc', 'pptx', 'ppt', 'xlsx', 'xls'))
+
+# 扩展名 -> 文件列表响应中的分类，新增文件类型只需修改上面的集合
+_EXTENSION_KINDS = {
+    **dict.fromkeys(IMAGE_EXTENSIONS, 'images'),
+    **dict.fromkeys(DOCUMENT_EXTENSIONS, 'documents'),
+}
+
+def _load_index():
+    """
+    读取index.html（只在启动时执行一次，修改页面后需重启服务）
+    
+    Returns:
+        (文件内容, Content-Length字符串, ETag)，文件不存在时均为None
+    """
+    try:
+        with open(_INDEX_PATH, 'rb') as f:
+            content = f.read()
+    except FileNotFoundError:
+        logger.error("index.html not found: %s", _INDEX_PATH)
+        return None, None, None
+    return content, str(len(content)), f'"{hashlib.md5(content).hexdigest()}"'
+
+_INDEX_BYTES, _INDEX_LEN, _INDEX_ETAG = _load_index()
+
+# /chatbot返回的简易聊天页面（内容固定，启动时编码一次）
+_CHATBOT_HTML = """<!DOCTYPE html>
 <html>
 <head>
     <title>画廊AI助手</title>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <style>
-        body {{ margin: 0; padding: 0; font-family: Arial, sans-serif; }}
-        .chatbox {{ display: flex; flex-direction: column; height: 100vh; }}
-        .messages {{ flex-grow: 1; overflow-y: auto; padding: 20px; background-color: #f5f5f5; }}
-        .input-area {{ display: flex; padding: 10px; background-color: white; border-top: 1px solid #ddd; }}
-        #user-input {{ flex-grow: 1; padding: 10px; border: 1px solid #ddd; border-radius: 4px; }}
-        button {{ margin-left: 10px; padding: 10px 20px; background-color: #4CAF50; color: white; border: none; border-radius: 4px; cursor: pointer; }}
-        .message {{ margin-bottom: 10px; padding: 10px; border-radius: 4px; max-width: 70%; }}
-        .user-message {{ background-color: #DCF8C6; align-self: flex-end; margin-left: auto; }}
-        .bot-message {{ background-color: white; align-self: flex-start; }}
-        .status {{ padding: 5px 10px; margin-bottom: 15px; border-radius: 4px; font-size: 0.9em; }}
-        .status-info {{ background-color: #e3f2fd; color: #0d47a1; }}
+        body { margin: 0; padding: 0; font-family: Arial, sans-serif; }
+        .chatbox { display: flex; flex-direction: column; height: 100vh; }
+        .messages { flex-grow: 1; overflow-y: auto; padding: 20px; background-color: #f5f5f5; }
+        .input-area { display: flex; padding: 10px; background-color: white; border-top: 1px solid #ddd; }
+        #user-input { flex-grow: 1; padding: 10px; border: 1px solid #ddd; border-radius: 4px; }
+        button { margin-left: 10px; padding: 10px 20px; background-color: #4CAF50; color: white; border: none; border-radius: 4px; cursor: pointer; }
+        .message { margin-bottom: 10px; padding: 10px; border-radius: 4px; max-width: 70%; }
+        .user-message { background-color: #DCF8C6; align-self: flex-end; margin-left: auto; }
+        .bot-message { background-color: white; align-self: flex-start; }
+        .status { padding: 5px 10px; margin-bottom: 15px; border-radius: 4px; font-size: 0.9em; }
+        .status-info { background-color: #e3f2fd; color: #0d47a1; }
     </style>
 </head>
 <body>
@@ -113,23 +118,23 @@ class GalleryHandler(SimpleHTTPRequestHandler):
     </div>
 
     <script>
-        document.getElementById('send-btn').addEventListener('click', function() {{
+        document.getElementById('send-btn').addEventListener('click', function() {
             sendMessage();
-        }});
+        });
         
-        document.getElementById('user-input').addEventListener('keypress', function(e) {{
-            if (e.key === 'Enter') {{
+        document.getElementById('user-input').addEventListener('keypress', function(e) {
+            if (e.key === 'Enter') {
                 sendMessage();
-            }}
-        }});
+            }
+        });
         
         let sessionId = null;
         
-        function sendMessage() {{
+        function sendMessage() {
             const input = document.getElementById('user-input');
             const message = input.value.trim();
             
-            if (message) {{
+            if (message) {
                 // 显示用户消息
                 addMessage(message, 'user');
                 input.value = '';
@@ -138,52 +143,88 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 const typingIndicator = addMessage('正在思考...', 'bot');
                 
                 // 准备请求数据
-                const requestData = {{ 
+                const requestData = { 
                     message: message,
-                    session_id: sessionId  // 包含会话ID
-                }};
+                    session_id: sessionId,  // 包含会话ID
+                    stream: true            // 请求流式输出
+                };
                 
                 // 发送到后端
-                fetch('/chatbot-api', {{
+                fetch('/chatbot-api', {
                     method: 'POST',
-                    headers: {{
+                    headers: {
                         'Content-Type': 'application/json',
-                    }},
+                    },
                     body: JSON.stringify(requestData),
-                }})
-                .then(response => response.json())
-                .then(data => {{
+                })
+                .then(response => {
+                    const contentType = response.headers.get('Content-Type') || '';
+                    if (!contentType.startsWith('application/x-ndjson') || !response.body) {
+                        return response.json();
+                    }
+                    return readStream(response, typingIndicator);
+                })
+                .then(data => {
                     // 移除输入指示器
                     typingIndicator.remove();
                     
                     // 更新会话ID
-                    if (data.session_id) {{
+                    if (data.session_id) {
                         sessionId = data.session_id;
-                    }}
+                    }
                     
                     // 显示机器人回复
                     const responseText = data.response || '抱歉，无法处理您的请求';
                     addMessage(responseText, 'bot');
                     
                     // 显示信息来源（如果有）
-                    if (data.source_type && data.source_type !== 'unknown') {{
+                    if (data.source_type && data.source_type !== 'unknown') {
                         const sourceInfo = getSourceTypeDisplay(data.source_type);
-                        addMessage(`💡 ${{sourceInfo}}`, 'info');
-                    }}
-                }})
-                .catch(error => {{
+                        addMessage(`💡 ${sourceInfo}`, 'info');
+                    }
+                })
+                .catch(error => {
                     // 移除输入指示器
                     typingIndicator.remove();
                     
                     // 显示错误
                     addMessage('抱歉，发生了错误，请稍后再试。', 'bot');
                     console.error('Error:', error);
-                }});
-            }}
-        }}
+                });
+            }
+        }
         
-        function getSourceTypeDisplay(sourceType) {{
-            const sourceMap = {{
+        // 逐行读取NDJSON流，片段到达时更新输入指示器，返回最后的完整响应
+        async function readStream(response, typingIndicator) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let text = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) {
+                    break;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line) {
+                        continue;
+                    }
+                    const event = JSON.parse(line);
+                    if (event.done) {
+                        return event;
+                    }
+                    text += event.delta;
+                    typingIndicator.textContent = text;
+                }
+            }
+            throw new Error('流式响应意外结束');
+        }
+        
+        function getSourceTypeDisplay(sourceType) {
+            const sourceMap = {
                 'document_only': '回答基于本地文档',
                 'document+internet': '回答基于本地文档和网络搜索',
                 'internet_only': '回答基于网络搜索',
@@ -191,25 +232,25 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 'chatbot': '回答基于AI助手',
                 'agent': '回答基于AI智能代理',
                 'fallback': '基础回复模式'
-            }};
+            };
             return sourceMap[sourceType] || '回答来源未知';
-        }}
+        }
         
-        function addMessage(text, sender) {{
+        function addMessage(text, sender) {
             const messagesDiv = document.getElementById('chat-messages');
             const messageDiv = document.createElement('div');
             messageDiv.classList.add('message');
             
-            if (sender === 'user') {{
+            if (sender === 'user') {
                 messageDiv.classList.add('user-message');
-            }} else if (sender === 'info') {{
+            } else if (sender === 'info') {
                 messageDiv.classList.add('bot-message');
                 messageDiv.style.fontSize = '0.9em';
                 messageDiv.style.fontStyle = 'italic';
                 messageDiv.style.opacity = '0.8';
-            }} else {{
+            } else {
                 messageDiv.classList.add('bot-message');
-            }}
+            }
             
             messageDiv.textContent = text;
             messagesDiv.appendChild(messageDiv);
@@ -218,21 +259,150 @@ class GalleryHandler(SimpleHTTPRequestHandler):
             messagesDiv.scrollTop = messagesDiv.scrollHeight;
             
             return messageDiv;
-        }}
+        }
     </script>
 </body>
 </html>"""
+_CHATBOT_BYTES = _CHATBOT_HTML.encode('utf-8')
+_CHATBOT_LEN = str(len(_CHATBOT_BYTES))
+
+def natural_sort_key(filename):
+    """自然排序键函数，正确处理数字序列"""
+    # 分离数字和文字部分
+    parts = re.split(r'(\d+)', filename.lower())
+    # 将数字部分转换为整数进行排序
+    for i in range(len(parts)):
+        if parts[i].isdigit():
+            parts[i] = int(parts[i])
+    return parts
+
+def _build_listing(images_dir):
+    """
+    扫描画廊目录，生成文件列表响应
+    
+    Args:
+        images_dir: 画廊目录路径
+    
+    Returns:
+        JSON编码后的响应体
+    """
+    # 遍历目录并按扩展名分类文件（scandir复用目录项信息，每个文件只取一次扩展名）
+    listing = {'images': [], 'documents': []}
+    kinds = _EXTENSION_KINDS
+    with os.scandir(images_dir) as entries:
+        for entry in entries:
+            _, dot, ext = entry.name.rpartition('.')
+            kind = kinds.get(ext.lower()) if dot else None
+            if kind is not None and entry.is_file():
+                listing[kind].append(entry.name)
+    
+    # 对图片和文档分别进行自然排序（支持数字排序）
+    for names in listing.values():
+        names.sort(key=natural_sort_key)
+    logger.info("重新生成文件列表: 图片 %s 个, 文档 %s 个", len(listing['images']), len(listing['documents']))
+    
+    return _json_dumps(listing)
+
+# 文件列表响应的固定响应头（状态行、Server和Date仍由send_response生成）
+_LISTING_HEADERS = (
+    b"Content-type: application/json; charset=utf-8\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Cache-Control: no-cache, no-store, must-revalidate\r\n"
+    b"Pragma: no-cache\r\n"
+    b"Expires: 0\r\n"
+)
+
+# 文件列表响应缓存，以目录的修改时间为键（增删、重命名文件都会更新目录修改时间）
+_listing_cache = {"mtime": None, "response": b""}
+_listing_cache_lock = threading.Lock()
+
+def get_listing_response(images_dir):
+    """
+    获取文件列表响应（固定响应头、Content-Length、空行和响应体），目录未变化时直接返回缓存
+    
+    Args:
+        images_dir: 画廊目录路径
+    
+    Returns:
+        紧跟在状态行之后发送的字节串
+    
+    Raises:
+        FileNotFoundError: 目录不存在
+    """
+    mtime = os.stat(images_dir).st_mtime_ns
+    with _listing_cache_lock:
+        if _listing_cache["mtime"] != mtime:
+            body = _build_listing(images_dir)
+            response = b"%sContent-Length: %d\r\n\r\n%s" % (_LISTING_HEADERS, len(body), body)
+            _listing_cache.update(mtime=mtime, response=response)
+        return _listing_cache["response"]
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """处理请求的线程化版本的HTTP服务器"""
+    daemon_threads = True
+
+class GalleryHandler(SimpleHTTPRequestHandler):
+    # 使用HTTP/1.1保持连接（所有响应都带Content-Length），浏览器加载多张图片时复用同一连接
+    protocol_version = "HTTP/1.1"
+    # 每个连接占用一个线程，空闲的保持连接在超时前一直占着该线程。
+    # 超时设得很短：浏览器连续加载资源时仍能复用连接，空闲连接则很快释放线程
+    timeout = 5
+    
+    def do_GET(self):
+        # 规范化路径以处理各种URL编码问题
+        parsed_path = urllib.parse.urlparse(self.path)
+        path = parsed_path.path
+        
+        logger.info("处理GET请求: %s", path)
+        
+        # 处理根目录请求
+        if path == '/':
+            try:
+                if _INDEX_BYTES is None:
+                    logger.error("index.html not found: %s", _INDEX_PATH)
+                    self.send_error(404, "index.html not found")
+                    return
+                
+                # 浏览器缓存的版本与当前一致时不再发送内容
+                if self.headers.get('If-None-Match') == _INDEX_ETAG:
+                    self.send_response(304)
+                    self.send_header('ETag', _INDEX_ETAG)
+                    self.end_headers()
+                    return
                 
+                # 发送启动时读入内存的index.html
                 self.send_response(200)
                 self.send_header('Content-type', 'text/html; charset=utf-8')
-                self.send_header('Content-Length', str(len(html_content.encode('utf-8'))))
+                self.send_header('Content-Length', _INDEX_LEN)
+                self.send_header('ETag', _INDEX_ETAG)
                 self.end_headers()
-                self.wfile.write(html_content.encode('utf-8'))
+                self.wfile.write(_INDEX_BYTES)
+                return
+                
+            except Exception as e:
+                logger.error("处理根目录请求时出错: %s", e)
+                self.send_error(500, str(e))
+                return
+        
+        # 处理chatbot请求 - 直接内嵌聊天界面
+        elif path == '/chatbot':
+            try:
+                logger.info("提供简易聊天界面")
+                
+                # 检查API密钥
+                logger.info("当前API Key: %s", mask_api_key(os.environ.get('OPENAI_API_KEY')))
+                
+                # 返回启动时编码好的聊天页面
+                self.send_response(200)
+                self.send_header('Content-type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', _CHATBOT_LEN)
+                self.end_headers()
+                self.wfile.write(_CHATBOT_BYTES)
                 logger.info("成功返回聊天界面HTML")
                 return
                 
             except Exception as e:
-                logger.error(f"处理Chatbot请求时出错: {str(e)}")
+                logger.error("处理Chatbot请求时出错: %s", e)
                 self.send_error(500, str(e))
                 return
         
@@ -361,18 +531,27 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 self.wfile.write(html_content.encode('utf-8'))
                 return
             except Exception as e:
-                logger.error(f"管理面板错误: {e}")
+                logger.error("管理面板错误: %s", e)
                 self.send_error(500, str(e))
                 return
                 
         # 会话状态API
         elif path == '/api/session-stats':
             try:
+                # 可选的fields参数，只返回指定字段（如 ?fields=active_sessions,max_sessions）
+                query_params = urllib.parse.parse_qs(parsed_path.query)
+                fields = {f for f in query_params.get('fields', [''])[0].split(',') if f}
+                
                 if session_manager:
-                    stats = session_manager.get_stats()
+                    stats = session_manager.get_stats(
+                        include_sessions=not fields or 'sessions' in fields
+                    )
                 else:
                     stats = {"active_sessions": 0, "sessions": []}
                 
+                if fields:
+                    stats = {k: v for k, v in stats.items() if k in fields}
+                
                 response_json = json.dumps(stats, ensure_ascii=False).encode('utf-8')
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json; charset=utf-8')
@@ -382,77 +561,47 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 self.wfile.write(response_json)
                 return
             except Exception as e:
-                logger.error(f"获取会话统计失败: {e}")
+                logger.error("获取会话统计失败: %s", e)
+                self.send_error(500, str(e))
+                return
+        
+        # 完整健康检查API（会实际执行一次文档搜索）
+        elif path == '/api/deep-health':
+            try:
+                from resource_manager import get_resource_manager
+                health_status = get_resource_manager().deep_health_check()
+                
+                response_json = json.dumps(health_status, ensure_ascii=False).encode('utf-8')
+                self.send_response(200 if health_status.get('status') == 'healthy' else 503)
+                self.send_header('Content-type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(response_json)))
+                self.end_headers()
+                self.wfile.write(response_json)
+                return
+            except Exception as e:
+                logger.error("完整健康检查失败: %s", e)
                 self.send_error(500, str(e))
                 return
         
         # 处理/images和/images/请求
         elif path in ['/images', '/images/']:
             try:
-                # 获取images目录的绝对路径
-                images_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
-                logger.info(f"正在访问目录: {images_dir}")
-                
                 # 检查目录是否存在
-                if not os.path.exists(images_dir):
-                    logger.error(f"目录不存在: {images_dir}")
+                try:
+                    response = get_listing_response(_IMAGES_DIR)
+                except FileNotFoundError:
+                    logger.error("目录不存在: %s", _IMAGES_DIR)
                     self.send_error(404, "Images directory not found")
                     return
                 
-                # 获取文件列表
-                files = os.listdir(images_dir)
-                logger.info(f"找到文件: {files}")
-                
-                # 分类文件
-                images = []
-                documents = []
-                for file in files:
-                    if file.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
-                        images.append(file)
-                    elif file.lower().endswith(('.pdf', '.docx', '.doc', '.pptx', '.ppt', '.xlsx', '.xls')):
-                        documents.append(file)
-                
-                # 对文件列表进行自然排序（支持数字排序）
-                import re
-                def natural_sort_key(filename):
-                    """自然排序键函数，正确处理数字序列"""
-                    # 分离数字和文字部分
-                    parts = re.split(r'(\d+)', filename.lower())
-                    # 将数字部分转换为整数进行排序
-                    for i in range(len(parts)):
-                        if parts[i].isdigit():
-                            parts[i] = int(parts[i])
-                    return parts
-                
-                # 对图片和文档分别排序
-                images.sort(key=natural_sort_key)
-                documents.sort(key=natural_sort_key)
-                
-                logger.info(f"排序后的图片: {images}")
-                logger.info(f"排序后的文档: {documents}")
-                
-                # 准备响应
-                response = {
-                    'images': images,
-                    'documents': documents
-                }
-                
-                # 设置响应头
+                # 发送状态行，其余响应头和响应体为预先拼好的字节串，一次写出
                 self.send_response(200)
-                self.send_header('Content-type', 'application/json; charset=utf-8')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-                self.send_header('Pragma', 'no-cache')
-                self.send_header('Expires', '0')
-                self.end_headers()
-                
-                # 发送响应
-                self.wfile.write(json.dumps(response).encode('utf-8'))
-                logger.info(f"成功返回文件列表: {response}")
+                self.flush_headers()
+                self.wfile.write(response)
                 return
                 
             except Exception as e:
-                logger.error(f"处理请求时出错: {str(e)}")
+                logger.error("处理请求时出错: %s", e)
                 self.send_error(500, str(e))
                 return
         else:
@@ -469,7 +618,7 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 # 处理文件请求
                 super().do_GET()
             except Exception as e:
-                logger.error(f"处理文件请求时出错: {str(e)}")
+                logger.error("处理文件请求时出错: %s", e)
                 self.send_error(500, str(e))
 
     def do_POST(self):
@@ -477,7 +626,7 @@ class GalleryHandler(SimpleHTTPRequestHandler):
         parsed_path = urllib.parse.urlparse(self.path)
         path = parsed_path.path
         
-        logger.info(f"处理POST请求: {path}")
+        logger.info("处理POST请求: %s", path)
         
         # 处理文档内容API请求
         if path == '/api/document-content':
@@ -487,10 +636,10 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 post_data = self.rfile.read(content_length)
                 
                 # 解析JSON数据
-                data = json.loads(post_data.decode('utf-8'))
+                data = _json_loads(post_data)
                 filename = data.get('filename', '')
                 
-                logger.info(f"请求文档内容: {filename}")
+                logger.info("请求文档内容: %s", filename)
                 
                 if not filename:
                     raise ValueError("文件名不能为空")
@@ -529,10 +678,10 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                         }
                     }
                     
-                    logger.info(f"成功提取文档内容: {filename}, 长度: {len(content)} 字符")
+                    logger.info("成功提取文档内容: %s, 长度: %s 字符", filename, len(content))
                     
                 except Exception as e:
-                    logger.error(f"提取文档内容失败: {filename} - {e}")
+                    logger.error("提取文档内容失败: %s - %s", filename, e)
                     response_data = {
                         'success': False,
                         'error': str(e),
@@ -550,7 +699,7 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 return
                 
             except Exception as e:
-                logger.error(f"处理文档内容API请求时出错: {str(e)}")
+                logger.error("处理文档内容API请求时出错: %s", e)
                 # 发送错误响应
                 error_response = json.dumps({
                     'success': False,
@@ -571,10 +720,10 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 # 获取请求内容
                 content_length = int(self.headers['Content-Length'])
                 post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
+                data = _json_loads(post_data)
                 message = data.get('message', '')
                 
-                logger.info(f"收到聊天信息: {message}")
+                logger.info("收到聊天信息: %s", message)
                 
                 # 会话管理 - 获取或创建会话ID
                 session_id = data.get('session_id')
@@ -582,9 +731,9 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                     if session_manager:
                         try:
                             session_id = session_manager.create_session()
-                            logger.info(f"为新用户创建会话: {session_id}")
+                            logger.info("为新用户创建会话: %s", session_id)
                         except Exception as e:
-                            logger.error(f"创建会话失败: {e}")
+                            logger.error("创建会话失败: %s", e)
                             raise Exception("系统繁忙，请稍后重试")
                     else:
                         # 回退到原有逻辑
@@ -599,13 +748,19 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                         try:
                             session_id = session_manager.create_session()
                             user_session = session_manager.get_session(session_id)
-                            logger.info(f"会话过期或不存在，创建新会话: {session_id}")
+                            logger.info("会话过期或不存在，创建新会话: %s", session_id)
                         except Exception as e:
-                            logger.error(f"重新创建会话失败: {e}")
+                            logger.error("重新创建会话失败: %s", e)
                             raise Exception("系统繁忙，请稍后重试")
                     
+                    # 客户端请求流式输出时按NDJSON分块边生成边返回（分块传输需要HTTP/1.1）
+                    if data.get('stream') and self.request_version == 'HTTP/1.1':
+                        logger.info("流式处理会话 %s 的消息", session_id)
+                        self._send_chat_stream(user_session, message, session_id)
+                        return
+                    
                     # 使用用户专属的会话处理查询
-                    logger.info(f"处理会话 {session_id} 的消息")
+                    logger.info("处理会话 %s 的消息", session_id)
                     result = user_session.query(message)
                     response = result.get("answer", "抱歉，无法处理您的请求")
                     success = result.get("success", False)
@@ -633,7 +788,7 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 return
                 
             except Exception as e:
-                logger.error(f"处理聊天API请求时出错: {str(e)}")
+                logger.error("处理聊天API请求时出错: %s", e)
                 # 发送错误响应
                 error_response = json.dumps({
                     'error': str(e),
@@ -664,7 +819,7 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 self.wfile.write(response_json)
                 return
             except Exception as e:
-                logger.error(f"清理会话失败: {e}")
+                logger.error("清理会话失败: %s", e)
                 self.send_error(500, str(e))
                 return
         else:
@@ -672,6 +827,60 @@ class GalleryHandler(SimpleHTTPRequestHandler):
             self.send_error(405, "Method not allowed")
             return
     
+    def _send_chat_stream(self, user_session, message: str, session_id: str):
+        """
+        以分块传输流式返回聊天回答，每行一个JSON对象
+        
+        先逐条发送 {"delta": 回答片段}，最后发送一条带 "done": true 的完整响应
+        （字段与非流式响应相同）。响应头发出后出错时直接断开连接。
+        
+        Args:
+            user_session: 用户会话
+            message: 用户消息
+            session_id: 会话ID
+        """
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        
+        try:
+            for event in user_session.stream_query(message):
+                if event.get('done'):
+                    payload = {
+                        'done': True,
+                        'response': event.get('answer', '抱歉，无法处理您的请求'),
+                        'session_id': session_id,
+                        'success': event.get('success', False),
+                        'source_type': event.get('search_type', 'unknown')
+                    }
+                else:
+                    payload = {'delta': event['delta']}
+                self._write_chunk(_json_dumps(payload) + b'\n')
+            self._write_chunk(b'')
+        except Exception as e:
+            logger.error("流式发送聊天回答失败: %s", e)
+            self.close_connection = True
+    
+    def _write_chunk(self, data: bytes):
+        """写出一个HTTP分块，空数据表示结束"""
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+    
+    def copyfile(self, source, outputfile):
+        """
+        发送静态文件内容
+        
+        发往客户端时使用socket.sendfile（sendfile(2)零拷贝，数据不经过Python缓冲区），
+        不支持时socket.sendfile自动退回普通发送。Content-Length已由send_head按文件大小设置。
+        """
+        if outputfile is self.wfile:
+            self.wfile.flush()
+            self.connection.sendfile(source)
+        else:
+            super().copyfile(source, outputfile)
+    
     def _fallback_chat_processing(self, message: str):
         """回退聊天处理方式"""
         try:
@@ -684,12 +893,12 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 from rag_chain import create_rag_chain
                 rag_chain = create_rag_chain()
                 rag_chain_available = rag_chain is not None
-                logger.info(f"RAG链可用: {rag_chain_available}")
+                logger.info("RAG链可用: %s", rag_chain_available)
             except Exception as e:
-                logger.error(f"无法创建RAG链: {e}")
+                logger.error("无法创建RAG链: %s", e)
                 rag_chain_available = False
             
-            logger.info(f"chatbot可用: {chatbot_available}, RAG链可用: {rag_chain_available}")
+            logger.info("chatbot可用: %s, RAG链可用: %s", chatbot_available, rag_chain_available)
             
             # 优先使用RAG链
             if rag_chain_available:
@@ -698,10 +907,10 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                     result = rag_chain.query(message)
                     response = result.get("answer", "")
                     search_type = result.get("search_type", "rag")
-                    logger.info(f"RAG链回复: {response[:50]}...")
+                    logger.info("RAG链回复: %s...", response[:50])
                     return True, response, search_type
                 except Exception as e:
-                    logger.error(f"RAG链处理错误: {e}")
+                    logger.error("RAG链处理错误: %s", e)
                     # 继续尝试chatbot
             
             # 使用普通聊天处理器
@@ -709,10 +918,10 @@ class GalleryHandler(SimpleHTTPRequestHandler):
                 try:
                     logger.info("使用chatbot处理器（回退模式）")
                     response = chatbot.chat_handler.chat(message)
-                    logger.info(f"聊天回复: {response[:50]}...")
+                    logger.info("聊天回复: %s...", response[:50])
                     return True, response, "chatbot"
                 except Exception as e:
-                    logger.error(f"chatbot处理器错误: {e}")
+                    logger.error("chatbot处理器错误: %s", e)
             
             # 最后的回退
             response = f"收到您的消息：{message}。感谢您的提问，我会尽力回答。"
@@ -720,7 +929,7 @@ class GalleryHandler(SimpleHTTPRequestHandler):
             return False, response, "fallback"
             
         except Exception as e:
-            logger.error(f"回退处理失败: {e}")
+            logger.error("回退处理失败: %s", e)
             return False, f"抱歉，处理您的请求时出现了问题: {str(e)}", "error"
 
 def ensure_chatbot_module():
@@ -739,13 +948,12 @@ def ensure_chatbot_module():
             logger.warning("matplotlib未安装，chatbot可能无法正常工作")
             
         # 检查chatbot.py是否存在
-        chatbot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chatbot.py')
-        if not os.path.exists(chatbot_path):
-            logger.error(f"未找到chatbot.py: {chatbot_path}")
+        if not os.path.exists(_CHATBOT_PATH):
+            logger.error("未找到chatbot.py: %s", _CHATBOT_PATH)
             return False
         
         # 动态加载模块
-        spec = importlib.util.spec_from_file_location("chatbot", chatbot_path)
+        spec = importlib.util.spec_from_file_location("chatbot", _CHATBOT_PATH)
         chatbot = importlib.util.module_from_spec(spec)
         sys.modules["chatbot"] = chatbot
         spec.loader.exec_module(chatbot)
@@ -753,7 +961,7 @@ def ensure_chatbot_module():
         logger.info("成功动态加载chatbot模块")
         return True
     except Exception as e:
-        logger.error(f"加载chatbot模块失败: {e}")
+        logger.error("加载chatbot模块失败: %s", e)
         return False
 
 def run(server_class=ThreadedHTTPServer, handler_class=GalleryHandler, port=8000):
@@ -763,7 +971,7 @@ def run(server_class=ThreadedHTTPServer, handler_class=GalleryHandler, port=8000
     # 启动服务器
     server_address = ('', port)
     httpd = server_class(server_address, handler_class)
-    logger.info(f'Starting server on port {port}...')
+    logger.info('Starting server on port %s...', port)
     
     try:
         httpd.serve_forever()
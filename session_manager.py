@@ -5,7 +5,7 @@
 import uuid
 import time
 import threading
-from typing import Dict, Optional
+from typing import Dict, Iterator, Optional
 from datetime import datetime, timedelta
 import logging
 
@@ -62,6 +62,38 @@ class UserSession:
                     "error": str(e)
                 }
     
+    def stream_query(self, message: str) -> Iterator[Dict]:
+        """
+        线程安全的流式查询处理，生成器运行期间持有会话锁
+        
+        Yields:
+            {"delta": 回答片段}，最后产出一个带 "done": True 的完整结果
+        """
+        with self._lock:
+            self.update_activity()
+            self._ensure_rag_chain()
+            
+            if not self.rag_chain:
+                yield {
+                    "answer": "抱歉，系统初始化失败，请稍后重试。",
+                    "success": False,
+                    "error": "RAG链未初始化",
+                    "done": True
+                }
+                return
+            
+            try:
+                yield from self.rag_chain.stream_query(message)
+                logger.info(f"会话 {self.session_id} 流式处理查询成功")
+            except Exception as e:
+                logger.error(f"会话 {self.session_id} 流式查询失败: {e}")
+                yield {
+                    "answer": f"抱歉，处理您的请求时出现了问题: {str(e)}",
+                    "success": False,
+                    "error": str(e),
+                    "done": True
+                }
+    
     def is_expired(self, max_idle_minutes: int = 30) -> bool:
         """检查会话是否过期"""
         return datetime.now() - self.last_activity > timedelta(minutes=max_idle_minutes)
@@ -167,15 +199,21 @@ class SessionManager:
         self._cleanup_thread.start()
         logger.info("会话清理线程已启动")
     
-    def get_stats(self) -> Dict:
-        """获取会话统计信息"""
+    def get_stats(self, include_sessions: bool = True) -> Dict:
+        """
+        获取会话统计信息
+        
+        Args:
+            include_sessions: 是否包含每个会话的详细信息
+        """
         with self._lock:
             active_sessions = []
-            for session in self.sessions.values():
-                try:
-                    active_sessions.append(session.get_info())
-                except Exception as e:
-                    logger.warning(f"获取会话信息失败: {e}")
+            if include_sessions:
+                for session in self.sessions.values():
+                    try:
+                        active_sessions.append(session.get_info())
+                    except Exception as e:
+                        logger.warning(f"获取会话信息失败: {e}")
             
             return {
                 "active_sessions": len(self.sessions),
@@ -0,0 +1,88 @@
+"""
+流式输出模块
+在后台线程执行LangChain组件，并把模型生成的片段逐个转交给调用方
+"""
+import queue
+import threading
+from typing import Any, AsyncIterator, Dict, Generator, Iterator, TypeVar
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers._streaming import _StreamingCallbackHandler
+
+T = TypeVar("T")
+
+# 后台执行结束的标记
+_DONE = object()
+
+class TokenQueueCallbackHandler(BaseCallbackHandler, _StreamingCallbackHandler):
+    """
+    把模型生成的每个非空片段放入队列的回调处理器
+
+    聊天模型只有在回调中存在 _StreamingCallbackHandler 时才会在invoke内改走流式接口
+    （BaseChatModel._should_stream），否则整段回答生成后才触发一次回调。
+    这样LLM本身仍以streaming=False构建，只有流式查询才走流式接口。
+    """
+
+    def __init__(self, tokens: "queue.SimpleQueue"):
+        """
+        初始化回调处理器
+
+        Args:
+            tokens: 接收生成片段的队列
+        """
+        self.tokens = tokens
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        # 工具调用轮次的片段没有文本内容，直接跳过
+        if token:
+            self.tokens.put(token)
+
+    def tap_output_iter(self, run_id: UUID, output: Iterator[T]) -> Iterator[T]:
+        # 只转发模型片段，不截取组件输出
+        return output
+
+    def tap_output_aiter(self, run_id: UUID, output: AsyncIterator[T]) -> AsyncIterator[T]:
+        return output
+
+def stream_invoke(runnable: Any, inputs: Dict[str, Any]) -> Generator[Dict[str, str], None, Any]:
+    """
+    在后台线程调用runnable.invoke，边执行边产出模型生成的片段
+
+    调用方提前停止迭代时，后台调用仍会执行完毕，结果被丢弃。
+
+    Args:
+        runnable: 支持invoke和callbacks配置的LangChain组件
+        inputs: 调用输入
+
+    Yields:
+        {"delta": 生成片段}
+
+    Returns:
+        invoke的返回值（通过 ``yield from`` 获取）
+    """
+    tokens = queue.SimpleQueue()
+    outcome = {}
+
+    def run() -> None:
+        try:
+            outcome["result"] = runnable.invoke(
+                inputs,
+                config={"callbacks": [TokenQueueCallbackHandler(tokens)]}
+            )
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            tokens.put(_DONE)
+
+    threading.Thread(target=run, name="rag-stream", daemon=True).start()
+
+    while True:
+        token = tokens.get()
+        if token is _DONE:
+            break
+        yield {"delta": token}
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
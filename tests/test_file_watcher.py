@@ -0,0 +1,64 @@
+"""
+文件监听测试
+使用真实的文件系统观察者，验证写入新文档后会触发处理
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_watcher import CoalescingHandler, DocumentEventHandler, _create_observer
+
+
+def watch(directory, processor_func):
+    """在directory上启动与FileWatcher相同的观察者和处理器组合，返回停止函数"""
+    coalescing_handler = CoalescingHandler(
+        DocumentEventHandler(str(directory), processor_func),
+        debounce_ms=50
+    )
+    coalescing_handler.start()
+    observer = _create_observer()
+    observer.schedule(coalescing_handler, str(directory), recursive=False)
+    observer.start()
+
+    def stop():
+        observer.stop()
+        observer.join()
+        coalescing_handler.stop()
+    return stop
+
+
+def test_new_document_is_processed(tmp_path):
+    processed = []
+    done = threading.Event()
+
+    def processor_func(file_path):
+        processed.append(file_path)
+        done.set()
+
+    stop = watch(tmp_path, processor_func)
+    try:
+        file_path = tmp_path / "doc.pdf"
+        with open(file_path, "wb") as f:
+            f.write(b"%PDF-1.4 test")
+        assert done.wait(5)
+    finally:
+        stop()
+
+    assert processed == [str(file_path)]
+
+
+def test_unsupported_file_ignored(tmp_path):
+    processed = []
+
+    stop = watch(tmp_path, processed.append)
+    try:
+        with open(tmp_path / "notes.txt", "w") as f:
+            f.write("text")
+        # 等待若干个合并窗口
+        threading.Event().wait(0.5)
+    finally:
+        stop()
+
+    assert processed == []
@@ -0,0 +1,132 @@
+"""
+搜索工具测试
+验证搜索结果缓存、相同请求合并、失败缓存过期和多服务回退
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import search_tools
+from search_tools import ttl_cache, search_with_fallback
+
+
+def make_tool(search_func, negative_ttl=30):
+    """创建一个search方法带缓存的假搜索工具类，每次调用都新建以免共享缓存"""
+
+    class FakeSearchTool:
+        calls = 0
+
+        @ttl_cache(maxsize=8, ttl=300, negative_ttl=negative_ttl)
+        def search(self, query, max_results=5):
+            FakeSearchTool.calls += 1
+            return search_func(query, max_results)
+
+    return FakeSearchTool
+
+
+def test_cache_hit():
+    tool_class = make_tool(lambda query, max_results: [{"content": query}])
+    tool = tool_class()
+
+    assert tool.search("AI") == [{"content": "AI"}]
+    # 查询规范化后相同，命中缓存
+    assert tool.search("  ai ") == [{"content": "AI"}]
+    assert tool_class.calls == 1
+    assert tool_class.search.cache.stats()["hits"] == 1
+
+    # 最大结果数不同是另一个缓存键
+    tool.search("AI", max_results=3)
+    assert tool_class.calls == 2
+
+
+def test_empty_results_not_cached():
+    tool_class = make_tool(lambda query, max_results: [])
+    tool = tool_class()
+
+    assert tool.search("AI") == []
+    assert tool.search("AI") == []
+    assert tool_class.calls == 2
+
+
+def test_single_flight():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_search(query, max_results):
+        started.set()
+        assert release.wait(5)
+        return [{"content": query}]
+
+    tool_class = make_tool(slow_search)
+    tool = tool_class()
+    results = []
+
+    def worker():
+        results.append(tool.search("AI"))
+
+    leader = threading.Thread(target=worker)
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    # 等待跟随的请求进入等待状态
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert tool_class.calls == 1
+    assert results == [[{"content": "AI"}]] * 5
+
+
+def test_negative_cache_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(search_tools.time, "monotonic", lambda: now[0])
+
+    def failing_search(query, max_results):
+        raise RuntimeError("服务不可用")
+
+    tool_class = make_tool(failing_search, negative_ttl=30)
+    tool = tool_class()
+
+    assert tool.search("AI") == []
+    assert tool_class.calls == 1
+
+    # 失败缓存有效期内不重复请求
+    now[0] += 29
+    assert tool.search("AI") == []
+    assert tool_class.calls == 1
+
+    now[0] += 2
+    assert tool.search("AI") == []
+    assert tool_class.calls == 2
+
+
+def test_failures_not_cached_without_negative_ttl():
+    def failing_search(query, max_results):
+        raise RuntimeError("服务不可用")
+
+    tool_class = make_tool(failing_search, negative_ttl=0)
+    tool = tool_class()
+
+    assert tool.search("AI") == []
+    assert tool.search("AI") == []
+    assert tool_class.calls == 2
+
+
+def test_search_with_fallback_returns_first_non_empty(monkeypatch):
+    failing = make_tool(lambda query, max_results: [])()
+    working = make_tool(lambda query, max_results: [{"content": "ok"}])()
+    monkeypatch.setattr(search_tools, "get_search_tools", lambda: [failing, working])
+
+    assert search_with_fallback("AI") == [{"content": "ok"}]
+
+
+def test_search_with_fallback_without_tools(monkeypatch):
+    monkeypatch.setattr(search_tools, "get_search_tools", lambda: [])
+
+    assert search_with_fallback("AI") == []
@@ -0,0 +1,88 @@
+"""
+语义缓存测试
+验证相似度阈值命中、TTL过期和环形缓冲覆盖
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import semantic_cache
+from semantic_cache import SemanticCache
+
+
+def test_hit_above_threshold():
+    cache = SemanticCache(capacity=4, threshold=0.9, ttl=0)
+    cache.add([1.0, 0.0, 0.0], {"answer": "a"})
+
+    # 余弦相似度约0.995，达到阈值
+    assert cache.lookup([1.0, 0.1, 0.0]) == {"answer": "a"}
+
+
+def test_miss_below_threshold():
+    cache = SemanticCache(capacity=4, threshold=0.9, ttl=0)
+    cache.add([1.0, 0.0, 0.0], {"answer": "a"})
+
+    # 余弦相似度约0.707，未达到阈值
+    assert cache.lookup([1.0, 1.0, 0.0]) is None
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+
+
+def test_picks_most_similar_entry():
+    cache = SemanticCache(capacity=4, threshold=0.5, ttl=0)
+    cache.add([1.0, 0.0], {"answer": "x"})
+    cache.add([0.0, 1.0], {"answer": "y"})
+
+    assert cache.lookup([0.2, 1.0]) == {"answer": "y"}
+
+
+def test_zero_vector_ignored():
+    cache = SemanticCache(capacity=4, threshold=0.9, ttl=0)
+    cache.add([0.0, 0.0], {"answer": "a"})
+
+    assert len(cache) == 0
+    assert cache.lookup([0.0, 0.0]) is None
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "monotonic", lambda: now[0])
+    cache = SemanticCache(capacity=4, threshold=0.9, ttl=60)
+    cache.add([1.0, 0.0], {"answer": "a"})
+
+    now[0] += 59
+    assert cache.lookup([1.0, 0.0]) == {"answer": "a"}
+
+    now[0] += 2
+    assert cache.lookup([1.0, 0.0]) is None
+
+
+def test_ring_buffer_evicts_oldest():
+    cache = SemanticCache(capacity=2, threshold=0.99, ttl=0)
+    cache.add([1.0, 0.0, 0.0], {"answer": "first"})
+    cache.add([0.0, 1.0, 0.0], {"answer": "second"})
+    cache.add([0.0, 0.0, 1.0], {"answer": "third"})
+
+    assert len(cache) == 2
+    assert cache.lookup([1.0, 0.0, 0.0]) is None
+    assert cache.lookup([0.0, 1.0, 0.0]) == {"answer": "second"}
+    assert cache.lookup([0.0, 0.0, 1.0]) == {"answer": "third"}
+
+
+def test_dimension_change_resets_cache():
+    cache = SemanticCache(capacity=4, threshold=0.9, ttl=0)
+    cache.add([1.0, 0.0], {"answer": "2d"})
+    cache.add([1.0, 0.0, 0.0], {"answer": "3d"})
+
+    assert len(cache) == 1
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.lookup([1.0, 0.0, 0.0]) == {"answer": "3d"}
+
+
+def test_clear():
+    cache = SemanticCache(capacity=4, threshold=0.9, ttl=0)
+    cache.add([1.0, 0.0], {"answer": "a"})
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.lookup([1.0, 0.0]) is None
@@ -0,0 +1,79 @@
+"""
+流式输出测试
+验证stream_invoke在模型生成结束前就能拿到片段
+"""
+import os
+import sys
+import threading
+from typing import Any, Iterator, List, Optional
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from streaming import stream_invoke
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """逐个产出片段的假模型，产出第一个片段后等待放行才继续"""
+
+    tokens: List[str]
+    release: Any
+    finished: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        raise AssertionError("应走流式接口，而不是一次性生成")
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for i, token in enumerate(self.tokens):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+            if i == 0:
+                assert self.release.wait(5)
+        self.finished.set()
+
+
+def test_deltas_arrive_before_completion():
+    release = threading.Event()
+    finished = threading.Event()
+    model = FakeStreamingChatModel(tokens=["你", "好", "！"], release=release, finished=finished)
+
+    stream = stream_invoke(model, "hi")
+    first = next(stream)
+    assert first == {"delta": "你"}
+    # 模型还停在第一个片段之后，说明片段是边生成边转交的
+    assert not finished.is_set()
+
+    release.set()
+    deltas = [first]
+    while True:
+        try:
+            deltas.append(next(stream))
+        except StopIteration as stop:
+            result = stop.value
+            break
+
+    assert [d["delta"] for d in deltas] == ["你", "好", "！"]
+    assert finished.is_set()
+    assert result.content == "你好！"
+
+
+def test_errors_propagate():
+    model = FakeStreamingChatModel(tokens=[], release=threading.Event(), finished=threading.Event())
+    model.tokens = None
+
+    # 后台调用的异常应抛给调用方
+    with pytest.raises(TypeError):
+        list(stream_invoke(model, "hi"))